@@ -0,0 +1,412 @@
+"""
+Benchmarks for the simulation hot paths, from single calls up to whole rounds.
+
+    python benchmark.py --out results.json
+    python benchmark.py --quick --compare results.json
+
+Every case is run with fixed seeds on two genome sets: fresh random genomes,
+and the same genomes after many rounds of tandem duplication, which is what a
+long run ends up simulating. Results are written as json, one record per case
+with its rate (bot steps/s, genomes/s or calls/s), timings and peak memory, so
+runs on different engines or commits can be compared with --compare.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tracemalloc
+import contextlib
+import numpy as np
+from util import gradient_score, get_functional_genome, sequence_to_tree
+from genome_bot import genome_bot
+from spawner import spawner
+from mutation_engine import mutate_genomes
+from genome_compiler import reduce_sequence
+from gradient_mixture import gradient_lattice
+from population_engine import population_engine
+from evo_sim import evo_sim
+
+BENCHMARK_VERSION = 1
+
+
+def seed_all(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def length_summary(genomes):
+    lengths = np.array([len(g) for g in genomes])
+    return({"mean"   : float(lengths.mean()),
+            "median" : float(np.median(lengths)),
+            "p90"    : float(np.percentile(lengths, 90)),
+            "max"    : int(lengths.max())})
+
+
+def make_genome_sets(n, seed, dupe_rounds):
+
+    """
+    the genome sets every case runs on
+
+    fresh - random genomes as a run starts with (see evo_sim.get_random_raw_genomes)
+    evolved - the fresh genomes mutated dupe_rounds times with a tandem duplication
+              every time, without selection. genomes grow and gain repeats the way
+              survivors of a long run do
+    """
+
+    seed_all(seed)
+    with contextlib.redirect_stdout(sys.stderr):
+        sim = evo_sim(n, 1)
+    fresh = sim.get_random_raw_genomes(n, sim.raw_genome_length, sim.char_freq, sim.min_length)
+
+    mut_params = dict(sim.spawner.mutation_params)
+    mut_params["p_tandem_dupe"] = 1.0
+    mut_params["p_del"] = 0.0
+
+    evolved = fresh
+    for i in range(dupe_rounds):
+        evolved = [children[0] for children in mutate_genomes(evolved, 1, mut_params)]
+
+    return({"fresh" : fresh, "evolved" : evolved})
+
+
+def make_gradient(seed):
+
+    """
+    the gradient evo_sim builds, as the raw distributions and as a gradient_mixture
+    """
+
+    seed_all(seed)
+    with contextlib.redirect_stdout(sys.stderr):
+        sim = evo_sim(1, 1)
+    return(sim.gradient, sim.weights, sim.mixture, sim.x_range, sim.y_range)
+
+
+def measure(setup, run, repeats, seed, memory=True):
+
+    """
+    time run(setup()) repeats times, reseeding before every setup so each repeat
+    does the same work. run returns how many units (steps, genomes, calls) it did.
+    peak memory is taken from one extra traced repeat, so tracing doesn't slow
+    the timed ones, and only counts allocations made by run in this process
+    """
+
+    times = []
+    units = 0
+    for r in range(repeats):
+        seed_all(seed)
+        state = setup()
+        start = time.perf_counter()
+        units = run(state)
+        times.append(time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        seed_all(seed)
+        state = setup()
+        tracemalloc.start()
+        run(state)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    best = min(times)
+    return({"units"             : units,
+            "seconds_best"      : best,
+            "seconds_median"    : float(np.median(times)),
+            "repeats"           : repeats,
+            "rate"              : units / best if best > 0 else None,
+            "peak_memory_bytes" : peak})
+
+
+def micro_cases(genome_sets, gradient, args):
+
+    """
+    (name, genome set, unit, setup, run) for each single function benchmark
+    """
+
+    dists, weights, mixture, x_range, y_range = gradient
+    lattice = gradient_lattice(dists, weights, x_range, y_range, method="bicubic")
+    points = np.random.RandomState(args.seed).uniform(-1, 1, size=(args.calls, 2)).tolist()
+
+    def score_points(g, w):
+        def run(state):
+            for x, y in points:
+                gradient_score(g, w, x, y)
+            return(len(points))
+        return(run)
+
+    cases = [
+        ("gradient_score/distributions", None, "calls", lambda: None, score_points(dists, weights)),
+        ("gradient_score/mixture", None, "calls", lambda: None, score_points(mixture, weights)),
+        ("gradient_score/lattice", None, "calls", lambda: None, score_points(lattice, weights)),
+    ]
+
+    for set_name, genomes in genome_sets.items():
+        functional = [get_functional_genome(g) for g in genomes]
+        trees = [sequence_to_tree(f) for f in functional]
+        coefficients = [reduce_sequence(f) for f in functional]
+
+        def functional_run(state, genomes=genomes):
+            for g in genomes:
+                get_functional_genome(g)
+            return(len(genomes))
+
+        def tree_run(state, functional=functional):
+            for f in functional:
+                sequence_to_tree(f)
+            return(len(functional))
+
+        def bots_setup(trees=trees):
+            bots = []
+            for i in range(len(trees)):
+                pos = [random.random() * 2 - 1, random.random() * 2 - 1]
+                bots.append(genome_bot(f"b_{i}", mixture, weights, trees[i], pos, random.random(), "none", args.steps))
+            return(bots)
+
+        def get_move_run(bots):
+            for b in bots:
+                for i in range(args.steps):
+                    b.get_move()
+            return(len(bots) * args.steps)
+
+        def make_move_run(bots):
+            for b in bots:
+                for i in range(args.steps):
+                    b.make_move()
+            return(len(bots) * args.steps)
+
+        def evaluate_tree_run(bots):
+            values = np.random.random(9).tolist()
+            for b in bots:
+                b.evaluate_tree(b.tree, values)
+            return(len(bots))
+
+        def population_setup(coefficients=coefficients):
+            n = len(coefficients) * args.individuals
+            positions = np.random.uniform(-1, 1, size=(n, 2))
+            twists = np.random.random(n)
+            return(population_engine(mixture, weights, np.repeat(coefficients, args.individuals, axis=0), positions, twists, log_level="none"))
+
+        def population_run(engine):
+            engine.run(args.steps)
+            return(engine.n * args.steps)
+
+        def mutate_setup():
+            with contextlib.redirect_stdout(sys.stderr):
+                return(spawner(None))
+
+        def mutate_run(s, genomes=genomes):
+            for g in genomes:
+                s.mutate(g, args.spawn_number, s.mutation_params)
+            return(len(genomes) * args.spawn_number)
+
+        def mutate_batched_run(s, genomes=genomes):
+            mutate_genomes(genomes, args.spawn_number, s.mutation_params)
+            return(len(genomes) * args.spawn_number)
+
+        cases += [
+            ("get_functional_genome", set_name, "genomes", lambda: None, functional_run),
+            ("sequence_to_tree", set_name, "genomes", lambda: None, tree_run),
+            ("genome_bot.evaluate_tree", set_name, "genomes", bots_setup, evaluate_tree_run),
+            ("genome_bot.get_move", set_name, "bot_steps", bots_setup, get_move_run),
+            ("genome_bot.make_move", set_name, "bot_steps", bots_setup, make_move_run),
+            ("population_engine.run", set_name, "bot_steps", population_setup, population_run),
+            ("spawner.mutate", set_name, "genomes", mutate_setup, mutate_run),
+            ("mutation_engine.mutate_genomes", set_name, "genomes", mutate_setup, mutate_batched_run),
+        ]
+
+    return(cases)
+
+
+def round_cases(genome_sets, args):
+
+    """
+    (name, genome set, unit, setup, run) for a full evo_sim.run_round per engine.
+    every repeat gets a fresh evo_sim with an empty genome cache, so a case
+    measures a first round. worker start up is paid in setup, outside the timing
+    """
+
+    cases = []
+
+    for engine in args.engines:
+        for set_name, genomes in genome_sets.items():
+
+            def setup(engine=engine, genomes=genomes):
+                with contextlib.redirect_stdout(sys.stderr):
+                    sim = evo_sim(len(genomes), args.individuals)
+                    sim.engine = engine
+                    sim.workers = args.workers
+                    if args.gradient_mode != sim.gradient_mode:
+                        sim.set_gradient_mode(args.gradient_mode)
+                    sim.set_genomes_from_list(list(genomes))
+                    if engine != "population":
+                        sim.get_pool()
+                return(sim)
+
+            def run(sim):
+                with contextlib.redirect_stdout(sys.stderr):
+                    results = sim.run_round(0)
+                sim.close()
+                bots = len(sim.starting_genomes) * sim.individuals - results["simulations_saved"]
+                return(bots * sim.genome_sim_iterations)
+
+            cases.append((f"evo_sim.run_round/{engine}", set_name, "bot_steps", setup, run))
+
+    return(cases)
+
+
+def run_cases(cases, args, genome_sets):
+
+    results = []
+    for name, set_name, unit, setup, run in cases:
+        label = name if set_name is None else f"{name}[{set_name}]"
+        if args.filter is not None and not args.filter in label:
+            continue
+
+        repeats = args.round_repeats if name.startswith("evo_sim.run_round") else args.repeats
+        result = measure(setup, run, repeats, args.seed, not args.no_memory)
+        result["name"] = label
+        result["unit"] = unit
+
+        if set_name is not None:
+            result["genomes"] = len(genome_sets[set_name])
+            result["genome_set"] = set_name
+
+        results.append(result)
+        peak = "-" if result["peak_memory_bytes"] is None else f"{result['peak_memory_bytes'] / 2**20:.1f} MiB"
+        print(f"{label:<52} {result['rate']:>14,.0f} {unit}/s  {result['seconds_best']:.4f}s  {peak}", file=sys.stderr)
+
+    return(results)
+
+
+def get_commit():
+    try:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".git", "HEAD")) as f:
+            head = f.read().strip()
+        if head.startswith("ref: "):
+            with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".git", head[5:])) as f:
+                return(f.read().strip())
+        return(head)
+    except OSError:
+        return(None)
+
+
+def compare(results, baseline, tolerance):
+
+    """
+    print the rate of every case against a baseline run. returns the cases that
+    got slower by more than tolerance, as a fraction of the baseline rate
+    """
+
+    baseline_rates = {r["name"] : r["rate"] for r in baseline["cases"]}
+    regressions = []
+
+    for r in results:
+        if not r["name"] in baseline_rates or not baseline_rates[r["name"]] or not r["rate"]:
+            continue
+        ratio = r["rate"] / baseline_rates[r["name"]]
+        flag = ""
+        if ratio < 1 - tolerance:
+            flag = "  REGRESSION"
+            regressions.append(r["name"])
+        print(f"{r['name']:<52} {ratio:>6.2f}x{flag}", file=sys.stderr)
+
+    return(regressions)
+
+
+def parse_args(argv):
+
+    parser = argparse.ArgumentParser(description="benchmark the simulation hot paths")
+    parser.add_argument("--out", help="write results here as json, default stdout")
+    parser.add_argument("--compare", help="json from an earlier run to compare rates against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="slowdown that --compare counts as a regression")
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--genomes", type=int, default=200, help="genomes per set in the micro benchmarks")
+    parser.add_argument("--round-genomes", type=int, default=500, help="population size in the round benchmarks")
+    parser.add_argument("--individuals", type=int, default=9, help="bots per genome")
+    parser.add_argument("--dupe-rounds", type=int, default=200, help="tandem duplications behind the evolved genome set")
+    parser.add_argument("--steps", type=int, default=400, help="steps per bot in the micro benchmarks")
+    parser.add_argument("--calls", type=int, default=20000, help="points per gradient_score benchmark")
+    parser.add_argument("--spawn-number", type=int, default=5, help="children per parent in the mutation benchmarks")
+    parser.add_argument("--engines", default="population,pool", help="comma separated evo_sim engines for the round benchmarks")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--gradient-mode", default="exact", choices=["exact", "lattice"])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--round-repeats", type=int, default=1)
+    parser.add_argument("--filter", help="only run cases whose name contains this")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced repeat that measures peak memory")
+    parser.add_argument("--no-rounds", action="store_true", help="skip the round benchmarks")
+    parser.add_argument("--quick", action="store_true", help="small sizes, for a smoke test")
+
+    args = parser.parse_args(argv)
+    args.engines = [e for e in args.engines.split(",") if e]
+
+    if args.quick:
+        args.genomes = 20
+        args.round_genomes = 50
+        args.individuals = 3
+        args.dupe_rounds = 20
+        args.steps = 50
+        args.calls = 2000
+        args.repeats = 1
+
+    return(args)
+
+
+def main(argv):
+
+    args = parse_args(argv)
+
+    print("building genome sets", file=sys.stderr)
+    micro_sets = make_genome_sets(args.genomes, args.seed, args.dupe_rounds)
+    gradient = make_gradient(args.seed)
+
+    cases = micro_cases(micro_sets, gradient, args)
+    results = run_cases(cases, args, micro_sets)
+    genome_lengths = {f"micro/{k}" : length_summary(v) for k, v in micro_sets.items()}
+
+    if not args.no_rounds:
+        round_sets = make_genome_sets(args.round_genomes, args.seed, args.dupe_rounds)
+        results += run_cases(round_cases(round_sets, args), args, round_sets)
+        genome_lengths.update({f"round/{k}" : length_summary(v) for k, v in round_sets.items()})
+
+    report = {
+        "version" : BENCHMARK_VERSION,
+        "time"    : time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit"  : get_commit(),
+        "machine" : {"python"    : platform.python_version(),
+                     "numpy"     : np.__version__,
+                     "platform"  : platform.platform(),
+                     "processor" : platform.processor(),
+                     "cpus"      : os.cpu_count()},
+        "args"    : vars(args),
+        "genome_lengths" : genome_lengths,
+        # high water marks of the whole run, including worker processes
+        "max_rss_kb"          : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "max_rss_children_kb" : resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        "cases"   : results,
+    }
+
+    if args.out is None:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    else:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=1)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if len(regressions) > 0:
+            print(f"{len(regressions)} regressions", file=sys.stderr)
+            return(1)
+
+    return(0)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
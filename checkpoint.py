@@ -0,0 +1,280 @@
+import io
+import json
+import random
+import threading
+import numpy as np
+from scipy.stats import multivariate_normal
+from util import atomic_write
+from genome_arena import genome_arena
+from round_stats import stats_aggregator
+
+CHECKPOINT_VERSION = 1
+
+
+def pack_genomes(genomes, prefix, arrays):
+
+    """
+    add a genome list to arrays as a 2 bit packed buffer (see genome_arena)
+    """
+
+    arena = genome_arena(max(len(genomes), 1))
+    arena.add_many(genomes)
+    arrays[f"{prefix}_buffer"] = arena.buffer[:arena.offsets[arena.n]]
+    arrays[f"{prefix}_offsets"] = arena.offsets[:arena.n + 1]
+    arrays[f"{prefix}_lengths"] = arena.lengths[:arena.n]
+
+
+def unpack_genomes(prefix, arrays):
+
+    arena = genome_arena(0, 0)
+    arena.buffer = arrays[f"{prefix}_buffer"]
+    arena.offsets = arrays[f"{prefix}_offsets"]
+    arena.lengths = arrays[f"{prefix}_lengths"]
+    arena.n = len(arena.lengths)
+    return(arena.get_many(range(arena.n)))
+
+
+def json_array(obj):
+    return(np.frombuffer(json.dumps(obj).encode("utf-8"), dtype=np.uint8))
+
+
+def array_json(a):
+    return(json.loads(a.tobytes().decode("utf-8")))
+
+
+def capture_state(sim, lboard, round_number, offspring):
+
+    """
+    copy everything a resumed run needs at the end of a round. only cheap copies
+    are made here so the packing and writing can happen off the main thread
+
+    round_number - the round that just finished
+    offspring - the genomes for the next round
+    """
+
+    version, internal, gauss_next = random.getstate()
+    np_state = np.random.get_state()
+
+    state = {
+        "round"            : round_number,
+        "offspring"        : list(offspring),
+        "py_random"        : (version, internal, gauss_next),
+        "np_random"        : np_state,
+        "mutation_params"  : dict(sim.spawner.mutation_params),
+        "gradient"         : {"means"   : [np.asarray(g.mean).tolist() for g in sim.gradient],
+                              "covs"    : [np.asarray(g.cov).tolist() for g in sim.gradient],
+                              "weights" : list(sim.weights)},
+        "accumulated"      : None,
+        "leaderboard"      : None,
+    }
+
+    if sim.reuse_elite_results:
+        # keyed by genome id in the run, by genome string in the checkpoint
+        ids = list(sim.accumulated_stats.stats)
+        genomes = sim.registry.get_many(ids)
+        state["accumulated"] = {genomes[k] : [s[0], list(s[1]), list(s[2])] for k, s in enumerate(sim.accumulated_stats.stats.values())}
+
+    if lboard is not None:
+        # rounds in the store are on disk once committed
+        lboard.flush()
+
+        # rounds already in leaders_per_round are never changed, so the list is copied shallow
+        state["leaderboard"] = {"leaders_per_round" : list(lboard.leaders_per_round),
+                                "names_by_genome"   : dict(lboard.names_by_genome),
+                                "round_offset"      : lboard.round_offset}
+
+    return(state)
+
+
+def state_to_arrays(state):
+
+    """
+    flatten a captured state into named numpy arrays
+    """
+
+    arrays = {}
+
+    version, internal, gauss_next = state["py_random"]
+    np_name, keys, pos, has_gauss, cached_gaussian = state["np_random"]
+
+    meta = {
+        "version"         : CHECKPOINT_VERSION,
+        "round"           : state["round"],
+        "mutation_params" : state["mutation_params"],
+        "gradient"        : state["gradient"],
+        "py_version"      : version,
+        "py_gauss_next"   : gauss_next,
+        "np_name"         : np_name,
+        "np_pos"          : int(pos),
+        "np_has_gauss"    : int(has_gauss),
+        "np_cached_gaussian" : float(cached_gaussian),
+    }
+
+    arrays["py_internal"] = np.array(internal, dtype=np.uint32)
+    arrays["np_keys"] = np.asarray(keys, dtype=np.uint32)
+
+    pack_genomes(state["offspring"], "offspring", arrays)
+
+    if state["accumulated"] is not None:
+        genomes = list(state["accumulated"].keys())
+        values = list(state["accumulated"].values())
+        pack_genomes(genomes, "accumulated", arrays)
+        arrays["accumulated_counts"] = np.array([v[0] for v in values], dtype=np.int64)
+        arrays["accumulated_means"] = np.array([v[1] for v in values], dtype=float).reshape(-1, 3)
+        arrays["accumulated_m2"] = np.array([v[2] for v in values], dtype=float).reshape(-1, 3)
+        meta["accumulated"] = True
+
+    if state["leaderboard"] is not None:
+        names_by_genome = state["leaderboard"]["names_by_genome"]
+        pack_genomes(list(names_by_genome.keys()), "leader_genomes", arrays)
+        arrays["leader_names"] = json_array(list(names_by_genome.values()))
+        arrays["leaders_per_round"] = json_array(state["leaderboard"]["leaders_per_round"])
+        meta["leaderboard"] = True
+        meta["leaderboard_round_offset"] = state["leaderboard"]["round_offset"]
+
+    arrays["meta"] = json_array(meta)
+    return(arrays)
+
+
+def write_checkpoint(path, state):
+
+    """
+    write a captured state to path. the file is written next to its final name
+    and moved into place, so a crash leaves the previous checkpoint whole
+    """
+
+    arrays = state_to_arrays(state)
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+
+    with atomic_write(path, "wb") as f:
+        f.write(buffer.getbuffer())
+
+
+def read_checkpoint(path):
+
+    """
+    read a checkpoint back into the form returned by capture_state
+    """
+
+    with np.load(path) as data:
+        arrays = {k : data[k] for k in data.files}
+
+    meta = array_json(arrays["meta"])
+    if meta["version"] != CHECKPOINT_VERSION:
+        raise ValueError(f"unsupported checkpoint version: {meta['version']}")
+
+    gauss_next = meta["py_gauss_next"]
+    state = {
+        "round"           : meta["round"],
+        "offspring"       : unpack_genomes("offspring", arrays),
+        "py_random"       : (meta["py_version"], tuple(arrays["py_internal"].tolist()), gauss_next),
+        "np_random"       : (meta["np_name"], arrays["np_keys"], meta["np_pos"], meta["np_has_gauss"], meta["np_cached_gaussian"]),
+        "mutation_params" : meta["mutation_params"],
+        "gradient"        : meta["gradient"],
+        "accumulated"     : None,
+        "leaderboard"     : None,
+    }
+
+    if meta.get("accumulated"):
+        genomes = unpack_genomes("accumulated", arrays)
+        counts = arrays["accumulated_counts"].tolist()
+        means = arrays["accumulated_means"].tolist()
+        m2 = arrays["accumulated_m2"].tolist()
+        state["accumulated"] = {genomes[i] : [counts[i], means[i], m2[i]] for i in range(len(genomes))}
+
+    if meta.get("leaderboard"):
+        genomes = unpack_genomes("leader_genomes", arrays)
+        names = array_json(arrays["leader_names"])
+        state["leaderboard"] = {"leaders_per_round" : array_json(arrays["leaders_per_round"]),
+                                "names_by_genome"   : dict(zip(genomes, names)),
+                                "round_offset"      : meta.get("leaderboard_round_offset", 0)}
+
+    return(state)
+
+
+def restore_state(sim, lboard, state):
+
+    """
+    put a read checkpoint back into an evo_sim and leaderboard. returns the
+    round that finished and the offspring for the next one
+    """
+
+    gradient = state["gradient"]
+    sim.set_gradient([multivariate_normal(m, c) for m, c in zip(gradient["means"], gradient["covs"])], gradient["weights"])
+
+    sim.spawner.mutation_params = dict(state["mutation_params"])
+
+    if state["accumulated"] is not None:
+        sim.accumulated_stats = stats_aggregator()
+        for genome, s in state["accumulated"].items():
+            sim.accumulated_stats.stats[sim.registry.register(genome)] = s
+
+    if lboard is not None and state["leaderboard"] is not None:
+        lboard.leaders_per_round = state["leaderboard"]["leaders_per_round"]
+        lboard.names_by_genome = state["leaderboard"]["names_by_genome"]
+        lboard.round_offset = state["leaderboard"]["round_offset"]
+
+        # the store may hold rounds run after the checkpoint was taken
+        if lboard.store is not None:
+            lboard.store.truncate_after(state["round"])
+
+    random.setstate(state["py_random"])
+    np.random.set_state(state["np_random"])
+
+    return(state["round"], state["offspring"])
+
+
+class checkpoint_writer:
+
+    def __init__(self, path, asynchronous=True):
+
+        """
+        Writes checkpoints in a background thread so rounds don't wait on
+        compression and disk. At most one write is in flight: saving again
+        waits for the previous write first.
+
+        path - checkpoint file, replaced atomically on every write
+        asynchronous - False writes on the calling thread
+        """
+
+        self.path = path
+        self.asynchronous = asynchronous
+        self.thread = None
+        self.error = None
+
+    def save(self, sim, lboard, round_number, offspring):
+        state = capture_state(sim, lboard, round_number, offspring)
+        self.wait()
+
+        if not self.asynchronous:
+            write_checkpoint(self.path, state)
+            return
+
+        self.thread = threading.Thread(target=self.write, args=(state,), daemon=True)
+        self.thread.start()
+
+    def write(self, state):
+        try:
+            write_checkpoint(self.path, state)
+        except Exception as e:
+            self.error = e
+
+    def wait(self):
+
+        """
+        block until the last write is on disk. errors from the background write are raised here
+        """
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def close(self):
+        self.wait()
@@ -1,3 +1,7 @@
+import argparse
+import math
+import time
+import atexit
 import random
 import numpy as np
 from util import *
@@ -6,6 +10,17 @@ from sim_visualizer import sim_visualizer
 from multiprocessing import Pool
 from static_bot import static_bot
 from genome_bot import genome_bot
+from population_engine import population_engine
+from round_worker import init_worker, run_batch, run_bots_profiled
+from genome_cache import genome_cache
+from genome_registry import genome_registry
+from round_stats import stats_aggregator
+from round_metrics import round_metrics, ipc_bytes
+from round_profiler import round_profiler
+from gradient_mixture import gradient_mixture, gradient_lattice
+from checkpoint import checkpoint_writer, read_checkpoint, restore_state
+from leaderboard_log import leaderboard_log
+from leaderboard_store import leaderboard_store
 from scipy.stats import multivariate_normal
 
 class evo_sim:
@@ -23,6 +38,18 @@ class evo_sim:
         self.gradient_means = 1
         self.gradient, self.weights = self.define_gradient_and_weights(self.gradient_means, self.x_range, self.y_range)
 
+        # closed form version of the same gradient, used for scoring in the bots
+        # "lattice" samples it once on a grid and interpolates instead, at a cost that
+        # doesn't grow with the number of components. measured break-even against the
+        # exact mixture: scoring a population's points at once, bilinear is as fast at
+        # 1 component and about 2.5x faster at 3, bicubic breaks even around 4. scoring
+        # one point at a time (genome_bot) bilinear breaks even around 4, bicubic around 10
+        self.gradient_mode = "exact"
+        self.lattice_step = 0.01
+        self.lattice_margin = 0.2
+        self.lattice_method = "bilinear"
+        self.mixture = self.build_mixture()
+
         # Make raw genomes as random character strings
         print("making raw genomes")
         self.raw_genome_length = 1000
@@ -33,12 +60,43 @@ class evo_sim:
         self.individuals = individuals
         self.selection_percent = 0.37
 
+        # "bots" runs one genome_bot per individual in a process pool
+        # "population" steps every bot of the round together as numpy arrays
+        # "pool" splits the population into batches for worker processes (see round_worker)
+        self.engine = "pool"
+        self.workers = 10
+
+        # worker processes are started on first use and kept for every round (see get_pool)
+        self.pool = None
+        self.pool_startup_time = None
+
+        # simulate genomes with the same reduced policy only once per round
+        self.dedupe_phenotypes = True
+
+        # every distinct genome gets an integer id for the run (see genome_registry)
+        self.registry = genome_registry()
+
+        # prepared genomes, kept across rounds
+        self.genome_cache = genome_cache(resolve=self.registry.get)
+
+        # keep per bot results for genomes that survive into the next round.
+        # survivors run elite_top_up extra individuals instead of a full set
+        self.reuse_elite_results = False
+        self.elite_top_up = 0
+        self.accumulated_stats = stats_aggregator()
+
         # track the best scoring genomes across all runs and make new generations
         self.spawner = spawner(self)
 
         # visualize simulation results
         self.sim_visualizer = sim_visualizer(self)
 
+        # per phase timings and counts for every round. off until given a file (see round_metrics)
+        self.metrics = round_metrics()
+
+        # cProfile in this process and the workers for sampled rounds. off until given a file (see round_profiler)
+        self.profiler = round_profiler()
+
     def generate_random_genomes(self):
         self.starting_genomes = self.get_random_raw_genomes(self.n_genomes, self.raw_genome_length, self.char_freq, self.min_length)
 
@@ -83,25 +141,126 @@ class evo_sim:
         return(gradient, weights)
     
     
+    def build_mixture(self):
+
+        if self.gradient_mode == "lattice":
+            mixture = gradient_lattice(self.gradient, self.weights, self.x_range, self.y_range,
+                                       self.lattice_step, self.lattice_margin, self.lattice_method)
+            print(f"gradient lattice {mixture.nx}x{mixture.ny}, max interpolation error {mixture.max_error()}")
+            return(mixture)
+
+        return(gradient_mixture(self.gradient, self.weights))
+
+    def set_gradient_mode(self, mode):
+
+        """
+        switch between "exact" and "lattice" gradient scoring
+        """
+
+        self.gradient_mode = mode
+        self.mixture = self.build_mixture()
+
+        # workers hold the old gradient
+        self.close()
+
+    def set_gradient(self, gradient, weights):
+
+        """
+        replace the gradient, e.g. with the one saved in a checkpoint
+        """
+
+        self.gradient = gradient
+        self.weights = weights
+        self.set_gradient_mode(self.gradient_mode)
+        self.sim_visualizer = sim_visualizer(self)
+
+    def get_pool(self):
+
+        """
+        return the worker pool, starting it on first use. the same workers serve
+        every round, so process start up and imports are paid once per run
+        """
+
+        if self.pool is None:
+            start = time.perf_counter()
+            self.pool = Pool(self.workers, initializer=init_worker, initargs=(self.mixture,))
+            self.pool_startup_time = time.perf_counter() - start
+            print(f"started {self.workers} workers in {self.pool_startup_time:.2f}s")
+        return(self.pool)
+
+    def close(self):
+
+        """
+        shut down the worker pool
+        """
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def make_random_sequence(self, n, p):
         
         characters = ['[',']','0','1']
         s = "".join(np.random.choice(characters, p=p, size=n))
         return(s)
     
-    def get_random_raw_genomes(self, n, raw_genome_length, char_freq, min_length):
+    def get_random_raw_genomes(self, n, raw_genome_length, char_freq, min_length, max_batch_bytes=2**26):
+
+        """
+        draw random sequences until n of them have a functional genome of at least
+        min_length. sequences are drawn a batch at a time as one matrix and checked
+        together (see util.get_functional_lengths)
+
+        the np random stream ends up where drawing one sequence at a time with
+        make_random_sequence would leave it, so seeded runs get the same genomes
+        and the same draws afterwards
+
+        max_batch_bytes - rough limit on the memory a batch takes
+        """
+
+        characters = np.frombuffer(b'[]01', dtype=np.uint8)
+
+        # per symbol, np.random.choice takes a float64 draw and an int64 index, and
+        # get_functional_lengths five small int walk arrays plus int64 indices of up
+        # to every position. 96 bytes covers them with room to spare
+        bytes_per_row = 96 * max(raw_genome_length, 1)
+        max_rows = max(1, max_batch_bytes // bytes_per_row)
 
-        g = 0
         t = 0
+        accepted = 0
         genomes = []
 
-        while g < n and t < 10**9:
-            raw_seq = self.make_random_sequence(raw_genome_length, char_freq)
-            valid_tree = get_functional_genome(raw_seq, [0, len(raw_seq)])
-            if len(valid_tree) >= min_length:
-                genomes.append(raw_seq)
-                g+=1
-            t+=1
+        while len(genomes) < n and t < 10**9:
+
+            # size the batch from the acceptance rate so far
+            needed = n - len(genomes)
+            rate = max((accepted + 1) / (t + 1), 0.01)
+            rows = int(min(max(needed / rate * 1.1, 16), max_rows, 10**9 - t))
+
+            state = np.random.get_state()
+            batch = characters[np.random.choice(len(characters), p=char_freq, size=(rows, raw_genome_length))]
+            valid = np.flatnonzero(get_functional_lengths(batch) >= min_length)
+
+            used = rows
+            if len(valid) >= needed:
+                used = int(valid[needed - 1]) + 1
+                valid = valid[:needed]
+
+                # rewind, then advance by just the draws of the rows that were used
+                np.random.set_state(state)
+                np.random.random_sample(used * raw_genome_length)
+
+            genomes += [batch[i].tobytes().decode("ascii") for i in valid.tolist()]
+            accepted += len(valid)
+            t += used
+
         return(genomes)
 
     def run_round(self, round_number, genomes=[], make_figures=False, fig_dir="."):
@@ -109,53 +268,338 @@ class evo_sim:
         if len(genomes) == 0:
             genomes = self.starting_genomes
 
-        # Run simulations
-        print("setting up simulations")
-        bots_to_run = []
-        raw_genomes_by_bot_name = {}
+        metrics = self.metrics
+        metrics.start_round(round_number)
+        self.profiler.start_round(round_number)
+
+        with metrics.phase("prepare"):
+            # the round works on genome ids from here. strings are looked up only to
+            # mutate the parents and to name leaders
+            genome_ids = self.registry.register_many(genomes)
+
+            genomes_by_phenotype = {}
+            if self.dedupe_phenotypes:
+                genomes_by_phenotype = self.group_by_phenotype(genome_ids)
+                sim_genomes = [self.pick_representative(group) for group in genomes_by_phenotype.values()]
+            else:
+                sim_genomes = genome_ids
+
+            # genomes with results from earlier rounds only get topped up
+            individuals = [self.individuals] * len(sim_genomes)
+            if self.reuse_elite_results:
+                for i in range(len(sim_genomes)):
+                    if sim_genomes[i] in self.accumulated_stats:
+                        individuals[i] = self.elite_top_up
+
+        metrics.add("genomes", len(genomes))
+        metrics.add("unique_phenotypes", len(sim_genomes))
+        metrics.add("bots", sum(individuals))
+        metrics.add("bot_steps", sum(individuals) * self.genome_sim_iterations)
+
+        simulations_saved = len(genomes) * self.individuals - sum(individuals)
+        print(f"{len(sim_genomes)} distinct phenotypes in {len(genomes)} genomes, {simulations_saved} bot simulations saved")
+        print(f"genome cache: {self.genome_cache.stats()}")
+
+        # only figure rounds keep full move logs
+        log_level = "none"
+        if make_figures:
+            log_level = "full"
+
+        # per genome stats are folded in as results come back. genomes with
+        # results kept from earlier rounds start from those
+        aggregator = stats_aggregator(sim_genomes)
+        if self.reuse_elite_results:
+            aggregator.merge(self.accumulated_stats.subset(sim_genomes))
+
+        # Run simulations. the pool engine folds results into the aggregator as they arrive
+        with metrics.phase("simulate"):
+            if self.engine == "pool":
+                bot_summaries, move_log_dict, genome_ids_by_bot_name = self.run_pool(sim_genomes, individuals, make_figures, aggregator)
+            elif self.engine == "population":
+                finished_bots, genome_ids_by_bot_name = self.run_population(sim_genomes, individuals, log_level)
+            else:
+                finished_bots, genome_ids_by_bot_name = self.run_bots(sim_genomes, individuals, log_level)
+
+        with metrics.phase("summarize"):
+            if self.engine != "pool":
+                bot_summaries = self.sim_visualizer.round_bots_to_summary_dict(finished_bots)
+                move_log_dict = self.sim_visualizer.round_bots_to_move_log_dict(finished_bots)
+                aggregator.add_summaries(bot_summaries, genome_ids_by_bot_name)
+
+            # only genomes simulated this round are kept, so the store stays the size of one population
+            if self.reuse_elite_results:
+                self.accumulated_stats = aggregator
+
+            # every genome shares the stats of the simulated genome with its phenotype
+            aliases = []
+            for group, sim_genome in zip(genomes_by_phenotype.values(), sim_genomes):
+                for genome_id in group:
+                    if genome_id != sim_genome:
+                        aliases.append((genome_id, sim_genome))
+
+            # one table per round. its rankings are shared by the report, the leaderboard and the spawner
+            round_stats = aggregator.get_round_table().expand(aliases)
+
+        #self.spawner.summarize_and_store_genomes(all_stats)
+        #self.sim_visualizer.make_jsons(all_stats, finished_bots, genome_ids_by_bot_name, "data/round_bots")
+
+        with metrics.phase("report"):
+            fig = self.sim_visualizer.make_round_report(round_stats, bot_summaries, move_log_dict, genome_ids_by_bot_name, 5, 3, make_figures)
+            if make_figures:
+                figure_file = f"{fig_dir}/figures/round_{round_number}_report.png"
+                fig.write_image(figure_file)
+                current_figure_file = f"{fig_dir}/figures/most_recent_report.png"
+                fig.write_image(current_figure_file)
+
+        with metrics.phase("display"):
+            stats = ['mean_net_diff', 'mean_best_diff', 'mean_avg_diff']
+            bots_for_leaderboard = self.sim_visualizer.get_bots_to_display(stats, round_stats, bot_summaries, genome_ids_by_bot_name, 20, 3)
+
+        with metrics.phase("spawn"):
+            offspring = self.spawner.spawn_next_round(round_stats, self.selection_percent, registry=self.registry)
+
+            # forget genomes nothing refers to any more, keeping this round's, which
+            # includes the parents carried into the next one
+            if len(self.registry) > 2 * (len(genome_ids) + len(self.genome_cache)):
+                self.registry.retain(genome_ids + list(self.genome_cache.entries) + list(self.accumulated_stats.stats))
+
+        return {"offspring": offspring, 
+                "top_scoring_bots_by_stat" : bots_for_leaderboard,
+                "round_stats" : round_stats,
+                "genome_by_bot_name" : genome_ids_by_bot_name,
+                "genome_registry" : self.registry,
+                "unique_phenotypes" : len(sim_genomes),
+                "simulations_saved" : simulations_saved,
+                "genome_cache" : self.genome_cache.stats()}
+
+    def group_by_phenotype(self, genomes):
+
+        """
+        group genomes that reduce to the same policy. returns a dict of
+        genome id lists keyed by phenotype, in order of first appearance
+        """
+
+        genomes_by_phenotype = {}
+        for genome_id in genomes:
+            key = self.genome_cache.get(genome_id)["phenotype"]
+            if not key in genomes_by_phenotype:
+                genomes_by_phenotype[key] = []
+            genomes_by_phenotype[key].append(genome_id)
+
+        return(genomes_by_phenotype)
+
+    def pick_representative(self, group):
+
+        """
+        choose the genome to simulate for a phenotype group. prefers one with
+        results kept from earlier rounds
+        """
+
+        if self.reuse_elite_results:
+            for genome_id in group:
+                if genome_id in self.accumulated_stats:
+                    return(genome_id)
+        return(group[0])
+
+    def place_bots(self, genomes, individuals):
+
+        """
+        name and starting state of every bot of a round, shared by all engines.
+        each bot draws its position, then its twist, genome by genome. engines
+        give the same results only as long as they draw in this one order
 
-        i = 0
+        returns bot names, [x, y] positions and twists, one per bot in order,
+        and the genome id of each bot keyed by name
+        """
 
-        for raw_genome in genomes:
-            genome = get_functional_genome(raw_genome)
-            tree = sequence_to_tree(genome)
+        names = []
+        positions = []
+        twists = []
+        genome_ids_by_bot_name = {}
 
-            for j in range(self.individuals):
+        for i in range(len(genomes)):
+            for j in range(individuals[i]):
                 bot_name = f"b_{i}_{j}"
-                b = self.spawn_genome_bot(bot_name, tree)
-                raw_genomes_by_bot_name[bot_name] = raw_genome
-                bots_to_run.append((b, self.genome_sim_iterations))
-            
-            i += 1
+
+                positions.append(self.get_random_pos())
+                twists.append(random.random())
+
+                names.append(bot_name)
+                genome_ids_by_bot_name[bot_name] = genomes[i]
+
+        return(names, positions, twists, genome_ids_by_bot_name)
+
+    def run_bots(self, genomes, individuals=None, log_level="full"):
+
+        """
+        simulate each individual as its own genome_bot, in parallel
+
+        genomes - genome ids (see genome_registry)
+        individuals - optional number of bots per genome, default self.individuals
+        log_level - how much of each bot's history to keep (see genome_bot)
+        """
+
+        if individuals is None:
+            individuals = [self.individuals] * len(genomes)
+
+        print("setting up simulations")
+        names, positions, twists, genome_ids_by_bot_name = self.place_bots(genomes, individuals)
+
+        trees = {}
+        bots_to_run = []
+        for k in range(len(names)):
+            genome_id = genome_ids_by_bot_name[names[k]]
+            if not genome_id in trees:
+                trees[genome_id] = sequence_to_tree(self.genome_cache.get(genome_id)["functional"])
+
+            b = self.spawn_genome_bot(names[k], trees[genome_id], log_level, positions[k], twists[k])
+            bots_to_run.append((b, self.genome_sim_iterations))
 
         print(f"running round with {len(bots_to_run)} bots in parallel")
-                
-        with Pool(10) as p:
-            finished_bots = p.map(run_bot, bots_to_run)
-        
 
-        round_stats = summarize_run(finished_bots, raw_genomes_by_bot_name)
+        pool = self.get_pool()
+        if self.profiler.active:
+            finished_bots = self.run_bots_profiled(pool, bots_to_run)
+        else:
+            finished_bots = pool.map(run_bot, bots_to_run)
 
-        #self.spawner.summarize_and_store_genomes(all_stats)
-        #self.sim_visualizer.make_jsons(all_stats, finished_bots, raw_genomes_by_bot_name, "data/round_bots")
+        # sizes are measured by pickling again, so only when metrics are on
+        if self.metrics.enabled:
+            self.metrics.add("ipc_sent_bytes", sum(ipc_bytes(b) for b in bots_to_run))
+            self.metrics.add("ipc_received_bytes", sum(ipc_bytes(b) for b in finished_bots))
 
+        return(finished_bots, genome_ids_by_bot_name)
 
-        move_log_dict = self.sim_visualizer.round_bots_to_move_log_dict(finished_bots)
+    def run_bots_profiled(self, pool, bots_to_run):
 
-        fig = self.sim_visualizer.make_round_report(round_stats, move_log_dict, raw_genomes_by_bot_name, 5, 3, make_figures)
-        if make_figures:
-            figure_file = f"{fig_dir}/figures/round_{round_number}_report.png"
-            fig.write_image(figure_file)
-            current_figure_file = f"{fig_dir}/figures/most_recent_report.png"
-            fig.write_image(current_figure_file)
+        """
+        pool.map(run_bot, bots_to_run) with every worker profiling its share. bots
+        go out in a few chunks per worker so each chunk's stats come back once
+        """
 
-        stats = ['mean_net_diff', 'mean_best_diff', 'mean_avg_diff']
-        bots_for_leaderboard = self.sim_visualizer.get_bots_to_display(stats, round_stats, move_log_dict, raw_genomes_by_bot_name, 20, 3)
+        chunk_size = max(1, int(math.ceil(len(bots_to_run) / (self.workers * 4))))
+        chunks = [bots_to_run[i:i + chunk_size] for i in range(0, len(bots_to_run), chunk_size)]
 
-        offspring = self.spawner.spawn_next_round(round_stats, self.selection_percent)
-        return {"offspring": offspring, 
-                "top_scoring_bots_by_stat" : bots_for_leaderboard,
-                "genome_by_bot_name" : raw_genomes_by_bot_name}
+        finished_bots = []
+        for bots, stats in pool.map(run_bots_profiled, chunks):
+            finished_bots += bots
+            self.profiler.add_worker_stats(stats)
+
+        return(finished_bots)
+
+    def run_population(self, genomes, individuals=None, log_level="full"):
+
+        """
+        simulate every individual of every genome together in one population_engine
+
+        genomes - genome ids (see genome_registry)
+        individuals - optional number of bots per genome, default self.individuals
+        log_level - how much of each bot's history to keep (see population_engine)
+        """
+
+        if individuals is None:
+            individuals = [self.individuals] * len(genomes)
+
+        print("setting up population")
+        names, positions, twists, genome_ids_by_bot_name = self.place_bots(genomes, individuals)
+        coefficients = [self.genome_cache.get(genome_ids_by_bot_name[name])["coefficients"] for name in names]
+
+        print(f"running round with {len(names)} bots as one population")
+
+        engine = population_engine(self.mixture, self.weights, coefficients, positions, twists, names, log_level)
+        engine.run(self.genome_sim_iterations)
+
+        return(engine.finished_bots(), genome_ids_by_bot_name)
+
+    def run_pool(self, genomes, individuals=None, return_logs=False, aggregator=None):
+
+        """
+        simulate the round in worker processes with the compact protocol in
+        round_worker. workers get the gradient once, then batches of reduced
+        genomes and starting positions, and send back score summaries instead of bots
+
+        genomes - genome ids (see genome_registry)
+        individuals - optional number of bots per genome, default self.individuals
+        return_logs - also collect full move logs, for figures
+        aggregator - optional stats_aggregator (see round_stats). batches are added
+                     to it as they finish, in whatever order that is
+
+        returns score summaries, move logs (empty without return_logs) and the
+        genome id of each bot, all keyed by bot name
+        """
+
+        if individuals is None:
+            individuals = [self.individuals] * len(genomes)
+
+        print("setting up batches")
+        names, positions, twists, genome_ids_by_bot_name = self.place_bots(genomes, individuals)
+        coefficients = [self.genome_cache.get(genome_id)["coefficients"] for genome_id in genomes]
+
+        coefficients = np.array(coefficients, dtype=np.int64).reshape(len(genomes), -1)
+        individuals = np.array(individuals, dtype=int)
+        positions = np.array(positions, dtype=float).reshape(-1, 2)
+        twists = np.array(twists, dtype=float)
+        bot_offsets = np.concatenate([[0], np.cumsum(individuals)])
+
+        # a few batches per worker, split on genome boundaries
+        batches = []
+        batch_size = max(1, int(math.ceil(len(genomes) / (self.workers * 4))))
+        for start in range(0, len(genomes), batch_size):
+            end = min(start + batch_size, len(genomes))
+            if bot_offsets[end] == bot_offsets[start]:
+                continue
+            batches.append({
+                "genome_ids"   : np.arange(start, end),
+                "bot_offset"   : int(bot_offsets[start]),
+                "coefficients" : coefficients[start:end],
+                "individuals"  : individuals[start:end],
+                "positions"    : positions[bot_offsets[start]:bot_offsets[end]],
+                "twists"       : twists[bot_offsets[start]:bot_offsets[end]],
+                "iterations"   : self.genome_sim_iterations,
+                "return_logs"  : return_logs,
+                "profile"      : self.profiler.active,
+            })
+
+        print(f"running round with {len(names)} bots in {len(batches)} batches")
+
+        bot_summaries = {}
+        move_log_dict = {}
+
+        # sizes are measured by pickling again, so only when metrics are on
+        metrics = self.metrics
+        if metrics.enabled:
+            metrics.add("ipc_sent_bytes", sum(ipc_bytes(b) for b in batches))
+
+        pool = self.get_pool()
+
+        start = time.perf_counter()
+        for r in pool.imap_unordered(run_batch, batches):
+            if metrics.enabled:
+                metrics.add("ipc_received_bytes", ipc_bytes(r))
+                metrics.add("worker_cpu_seconds", r["cpu_seconds"])
+
+            if "profile" in r:
+                self.profiler.add_worker_stats(r.pop("profile"))
+
+            if aggregator is not None:
+                aggregator.add_results(r, genomes)
+
+            k = r["bot_offset"]
+            for b in range(len(r["genome_ids"])):
+                bot_summaries[names[k]] = {"start" : float(r["start"][b]),
+                                           "final" : float(r["final"][b]),
+                                           "max"   : float(r["max"][b]),
+                                           "mean"  : float(r["mean"][b])}
+                if return_logs:
+                    move_log_dict[names[k]] = {'x' : r["x"][b].tolist(),
+                                               'y' : r["y"][b].tolist(),
+                                               's' : r["s"][b].tolist()}
+                k += 1
+
+        elapsed = time.perf_counter() - start
+        metrics.add("worker_wall_seconds", elapsed)
+        print(f"workers finished in {elapsed:.2f}s")
+        return(bot_summaries, move_log_dict, genome_ids_by_bot_name)
 
     def get_random_pos(self):
 
@@ -173,95 +617,300 @@ class evo_sim:
         pos = self.get_random_pos()
         return(static_bot(self.sim, name, pos))
 
-    def spawn_genome_bot(self, name, tree):
-        pos = self.get_random_pos()
-        twist = random.random()
-        bot = genome_bot(name, self.gradient, self.weights, tree, pos, twist)
+    def spawn_genome_bot(self, name, tree, log_level="full", pos=None, twist=None):
+
+        # draws as place_bots does when the starting state isn't given
+        if pos is None:
+            pos = self.get_random_pos()
+        if twist is None:
+            twist = random.random()
+        bot = genome_bot(name, self.mixture, self.weights, tree, pos, twist, log_level, self.genome_sim_iterations)
         return(bot)
 
 class leaderboard:
 
-    def __init__(self):
+    def __init__(self, log=None, store=None, window=1000, name_cache=100000):
+
+        """
+        log - optional leaderboard_log. every added round is appended to it
+        store - optional leaderboard_store. every round and genome name is kept
+                there, and memory only holds the last window rounds and the
+                name_cache most recently used names. without a store everything
+                stays in memory
+        """
 
         self.n = 20
         self.leaders_per_round = []
         self.stats = ['mean_net_diff', 'mean_best_diff', 'mean_avg_diff']
 
+        # round number of leaders_per_round[0]
+        self.round_offset = 0
+
         self.names_by_genome = {}
+        self.log = log
 
-    def add_round(self, round_num, top_bots_by_stat, genome_by_bot_name, genome_list_file=None):
+        self.store = store
+        self.window = window
+        self.name_cache = name_cache
+
+        # (genome, name) pairs named by the last add_round
+        self.new_names = []
+
+    def add_round(self, round_num, top_bots_by_stat, genome_by_bot_name, genome_list_file=None, round_stats=None, registry=None):
+
+        """
+        record the leading genomes of a round for each stat
+
+        round_stats - optional round_table for the round. when given, leaders are read
+                      straight from its shared rankings instead of from top_bots_by_stat
+        registry - genome_registry, when bots map to genome ids. leaders are
+                   looked up to their genome strings, which is what names are kept by
+        """
+
+        if round_stats is not None:
+            leaders_by_stat = self.get_leaders_from_table(round_stats, genome_by_bot_name)
+        else:
+            leaders_by_stat = self.get_leaders_from_bots(top_bots_by_stat, genome_by_bot_name)
+
+        self.new_names = []
 
         round_data = {}
         for stat in self.stats:
             round_data[stat] = []
             already_ranked_genomes = set()
 
-            for i in range(len(top_bots_by_stat[stat])):
-                b = top_bots_by_stat[stat][i]
-                g = genome_by_bot_name[b]
+            for i, g in leaders_by_stat[stat]:
+                if registry is not None:
+                    g = registry.get(g)
+
                 if not g in already_ranked_genomes:
 
-                    if not g in self.names_by_genome:
+                    name = self.get_name(g)
+                    if name is None:
                         name = f"round{round_num}_place{i}"
-                        self.names_by_genome[g] = name
-                    else:
-                        name = self.names_by_genome[g]
+                        self.set_name(g, name, round_num)
 
                     already_ranked_genomes.add(g)
                     round_data[stat].append(name)
         
         self.leaders_per_round.append(round_data)
+        if self.log is not None:
+            self.log.append(round_num, self.format_round(round_num, round_data))
+
+        if self.store is not None:
+            self.store.put_round(round_num, round_data)
+            if len(self.leaders_per_round) > self.window:
+                dropped = len(self.leaders_per_round) - self.window
+                del self.leaders_per_round[:dropped]
+                self.round_offset += dropped
 
         if genome_list_file:
             with open(genome_list_file) as glf:
                 for g in already_ranked_genomes:
-                    print(f"{self.names_by_genome[g]}\t{g}", file=glf)
+                    print(f"{self.get_name(g)}\t{g}", file=glf)
 
-    def write_leader_summary(self, outfile):
+    def get_name(self, genome):
+
+        """
+        leaderboard name of a genome, or None if it never placed
+        """
+
+        if genome in self.names_by_genome:
+            name = self.names_by_genome.pop(genome)
+            self.names_by_genome[genome] = name
+            return(name)
+
+        if self.store is None:
+            return(None)
+
+        name = self.store.get_name(genome)
+        if name is not None:
+            self.cache_name(genome, name)
+        return(name)
+
+    def set_name(self, genome, name, round_num):
+        self.cache_name(genome, name)
+        self.new_names.append((genome, name))
+        if self.store is not None:
+            self.store.put_name(genome, name, round_num)
+
+    def cache_name(self, genome, name):
+
+        """
+        keep a name in memory. with a store, the least recently used names are dropped past name_cache
+        """
+
+        self.names_by_genome[genome] = name
+        if self.store is not None:
+            while len(self.names_by_genome) > self.name_cache:
+                del self.names_by_genome[next(iter(self.names_by_genome))]
+
+    def get_round(self, round_num):
+
+        """
+        leaders of a round, from memory or the store. None if the round is unknown
+        """
+
+        i = round_num - self.round_offset
+        if 0 <= i < len(self.leaders_per_round):
+            return(self.leaders_per_round[i])
+        if self.store is not None:
+            return(self.store.get_round(round_num))
+        return(None)
+
+    def flush(self):
+        if self.store is not None:
+            self.store.commit()
+
+    def get_leaders_from_bots(self, top_bots_by_stat, genome_by_bot_name):
+
+        """
+        (place, genome) pairs for each stat, in the order of the top bots
+        """
+
+        leaders_by_stat = {}
+        for stat in self.stats:
+            bots = top_bots_by_stat[stat]
+            leaders_by_stat[stat] = [(i, genome_by_bot_name[bots[i]]) for i in range(len(bots))]
+        return(leaders_by_stat)
+
+    def get_leaders_from_table(self, round_stats, genome_by_bot_name):
+
+        """
+        (place, genome) pairs for the best self.n genomes by each stat, by table
+        rank. genomes place whether or not they ran bots this round, so elites
+        whose results were reused (see evo_sim.reuse_elite_results) stay on the board
+        """
+
+        leaders_by_stat = {}
+        for stat in self.stats:
+            top = round_stats.ranked_genomes(stat, self.n)
+            leaders_by_stat[stat] = [(place, g) for place, g in enumerate(top)]
+        return(leaders_by_stat)
+
+    def format_round(self, round_num, round_data):
+
+        """
+        the leader table of one round, as written to the summary
+        """
 
         header = ["rank"] + self.stats
+        lines = [f"Round {round_num} Leaders", "\t".join(header)]
+
+        for i in range(self.n):
+            line_elements = [str(i + 1)]
+            for stat in self.stats:
+                name = ""
+                if i < len(round_data[stat]):
+                    name = round_data[stat][i]
+                line_elements.append(name)
+            lines.append("\t".join(line_elements))
+
+        return("\n".join(lines) + "\n\n\n\n")
+
+    def write_leader_summary(self, outfile):
+
+        """
+        write every round held in memory. see leaderboard_log for output that grows with the new round only
+        """
 
         with open(outfile, 'w') as report:
-            
-            for round in range(len(self.leaders_per_round)):
-                print(f"Round {round} Leaders", file=report)
-                print("\t".join(header), file=report)
-                round_data = self.leaders_per_round[round]
-                for i in range(self.n):
-                    line_elements = [str(i + 1)]
-                    for stat in self.stats:
-                        name = round_data[stat][i]
-                        line_elements.append(name)
-                    print("\t".join(line_elements), file=report)
-                print("\n\n", file=report)
+            for i in range(len(self.leaders_per_round)):
+                report.write(self.format_round(self.round_offset + i, self.leaders_per_round[i]))
                 
 
 if __name__ == "__main__":
 
+    # python evo_sim.py --resume picks up after the last checkpoint
+    # --profile-rounds N stops after N profiled rounds, --profile-fraction F profiles
+    # that share of rounds. the profile goes to profile.prof (see round_profiler)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--profile-rounds", type=int, default=None)
+    parser.add_argument("--profile-fraction", type=float, default=None)
+    args = parser.parse_args()
+    resume = args.resume
+
     random.seed(11)
     np.random.seed(11)
-    lboard = leaderboard()
     base_out_dir = "/var/www/html/organism"
 
+    # full history is appended to the log a round at a time. the web page
+    # reads the last current_rounds rounds from leaderboard_current.tsv
+    current_rounds = 50
+    lboard_log = leaderboard_log(f"{base_out_dir}/figures/leaderboard_log.tsv", current_rounds)
+    # rounds and names past the in memory window are kept in the store
+    lboard_store = leaderboard_store(f"{base_out_dir}/figures/leaderboard.db")
+    lboard = leaderboard(lboard_log, lboard_store)
+
     report_at_round = 2500
 
+    # checkpoints are written in the background and replace the previous one
+    checkpoint_every = 100
+    checkpoints = checkpoint_writer(f"{base_out_dir}/checkpoint.npz")
+
     round = 0
     sim = evo_sim(2000, 9)
-    sim.generate_random_genomes()
 
-    round_results = sim.run_round(round, make_figures=True)
-    offspring = round_results['offspring']
-    top_bots_by_stat = round_results["top_scoring_bots_by_stat"]
-    genome_by_bot_name = round_results["genome_by_bot_name"]
-    lboard.add_round(round, top_bots_by_stat, genome_by_bot_name)
+    # one json line of phase timings per round. set prometheus_path to a file in the
+    # node exporter's textfile directory to export the last round there as well
+    sim.metrics = round_metrics(f"{base_out_dir}/metrics.jsonl", prometheus_path=None)
+
+    if args.profile_rounds is not None or args.profile_fraction is not None:
+        fraction = 1.0
+        if args.profile_fraction is not None:
+            fraction = args.profile_fraction
+        sim.profiler = round_profiler(f"{base_out_dir}/profile.prof", args.profile_rounds, fraction)
+
+    atexit.register(sim.close)
+    atexit.register(sim.metrics.close)
+    atexit.register(sim.profiler.close)
+    atexit.register(checkpoints.close)
+    atexit.register(lboard_log.close)
+    atexit.register(lboard_store.close)
+
+    # every name given so far, one per line. new names are appended each round
+    names_path = f"{base_out_dir}/figures/names_by_genome.txt"
+
+    if resume:
+        round, offspring = restore_state(sim, lboard, read_checkpoint(checkpoints.path))
+        lboard_log.truncate_after(round)
+
+        # the file may hold names given after the checkpoint, so it is rebuilt
+        # from the store, which restore_state cut back to the checkpoint's round
+        with atomic_write(names_path) as nbg:
+            for g, name in lboard_store.get_names():
+                print(f"{name}\t{g}", file=nbg)
+        print(f"resuming after round {round}")
+    else:
+        # a fresh run starts over on the history of any earlier run
+        lboard_log.truncate_after(-1)
+        lboard_store.truncate_after(-1)
+        open(names_path, 'w').close()
+
+        sim.generate_random_genomes()
+
+        round_results = sim.run_round(round, make_figures=True)
+        offspring = round_results['offspring']
+        top_bots_by_stat = round_results["top_scoring_bots_by_stat"]
+        genome_by_bot_name = round_results["genome_by_bot_name"]
+        lboard.add_round(round, top_bots_by_stat, genome_by_bot_name, round_stats=round_results["round_stats"], registry=sim.registry)
+
+        with open(names_path, 'a') as nbg:
+            for g, name in lboard.new_names:
+                print(f"{name}\t{g}", file=nbg)
 
-    print(f"len offspring: {len(offspring)}")
-    print(f"len genome_by_bot_name: {len(genome_by_bot_name)}")
+        print(f"len offspring: {len(offspring)}")
+        print(f"len genome_by_bot_name: {len(genome_by_bot_name)}")
 
-    lboard.write_leader_summary(f"figures/leaderboard_{round}.tsv")
+        lboard.write_leader_summary(f"figures/leaderboard_{round}.tsv")
   
     rounds = int(10**9)
-    for round in range(1, rounds):
+    for round in range(round + 1, rounds):
+
+        if sim.profiler.done():
+            print(f"profiled {sim.profiler.profiled_rounds} rounds, see {sim.profiler.path}.txt")
+            break
 
         make_figs = False
         if round % report_at_round == 0 or round == rounds - 1:
@@ -277,15 +926,18 @@ if __name__ == "__main__":
         if round > rounds * .9 and round % 100 == 0:
             genome_list_file = f"{base_out_dir}/figures/leaderboard_{round}.tsv"
 
-        lboard.add_round(round, top_bots_by_stat, genome_by_bot_name, genome_list_file)
+        with sim.metrics.phase("leaderboard"):
+            lboard.add_round(round, top_bots_by_stat, genome_by_bot_name, genome_list_file, round_results["round_stats"], sim.registry)
 
-        if round % report_at_round == 0:
-            lboard.write_leader_summary(f"{base_out_dir}/figures/leaderboard_{round}.tsv")
+            if round % report_at_round == 0:
+                lboard_log.write_current(f"{base_out_dir}/figures/leaderboard_{round}.tsv")
 
-        lboard.write_leader_summary(f"{base_out_dir}/figures/leaderboard_current.tsv")
-    
-        with open(f"{base_out_dir}/figures/names_by_genome.txt", 'w') as nbg:
-            for g in lboard.names_by_genome:
-                print(f"{lboard.names_by_genome[g][0]}\t{g}")
+            lboard_log.write_current(f"{base_out_dir}/figures/leaderboard_current.tsv")
 
+            with open(names_path, 'a') as nbg:
+                for g, name in lboard.new_names:
+                    print(f"{name}\t{g}", file=nbg)
 
+        if round % checkpoint_every == 0:
+            with sim.metrics.phase("checkpoint"):
+                checkpoints.save(sim, lboard, round, offspring)
@@ -0,0 +1,201 @@
+import numpy as np
+from util import get_functional_genome
+from genome_compiler import reduce_sequence
+from mutation_engine import encode_genomes, decode_genomes, gather_segments, mutate_encoded
+
+# 2 bit code of each genome symbol is its index here
+symbols = np.frombuffer(b'[]01', dtype=np.uint8)
+
+code_by_byte = np.full(256, 255, dtype=np.uint8)
+code_by_byte[symbols] = np.arange(len(symbols), dtype=np.uint8)
+
+
+def to_codes(buffer):
+
+    """
+    ascii genome bytes to 2 bit symbol codes, one per uint8
+    """
+
+    codes = code_by_byte[buffer]
+    if (codes == 255).any():
+        bad = bytes(buffer[codes == 255][:1].tolist())
+        raise ValueError(f"genome symbol not in [ ] 0 1: {bad}")
+    return(codes)
+
+
+def pack_codes(codes):
+
+    """
+    pack symbol codes four to a byte, first symbol in the low bits.
+    the last byte is padded with zeros
+    """
+
+    padded = np.zeros(-(-len(codes) // 4) * 4, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    padded = padded.reshape(-1, 4)
+
+    return(padded[:, 0] | (padded[:, 1] << 2) | (padded[:, 2] << 4) | (padded[:, 3] << 6))
+
+
+def unpack_codes(packed, n):
+
+    """
+    the first n symbol codes of a packed buffer
+    """
+
+    codes = (packed[:, None] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 3
+    return(codes.ravel()[:n])
+
+
+class genome_arena:
+
+    def __init__(self, capacity=1024, capacity_bytes=1 << 18):
+
+        """
+        Append only store of genomes packed at 2 bits per symbol in one contiguous
+        buffer. Every genome starts on a byte boundary and gets a stable integer id,
+        its position in the arena. A 1000 symbol genome takes 250 bytes plus 16 bytes
+        of offsets, against about 1 kB as a python str.
+
+        capacity - genomes to make room for up front
+        capacity_bytes - packed bytes to make room for up front
+        """
+
+        self.buffer = np.zeros(capacity_bytes, dtype=np.uint8)
+        self.offsets = np.zeros(capacity + 1, dtype=np.int64)  # byte offset of each genome
+        self.lengths = np.zeros(capacity, dtype=np.int64)      # symbols in each genome
+        self.n = 0
+
+    def reserve(self, genomes, n_bytes):
+
+        """
+        grow the arrays, doubling, to hold this many genomes and packed bytes in total
+        """
+
+        if genomes > len(self.lengths):
+            capacity = max(genomes, 2 * len(self.lengths))
+            self.lengths = np.concatenate([self.lengths, np.zeros(capacity - len(self.lengths), dtype=np.int64)])
+            self.offsets = np.concatenate([self.offsets, np.zeros(capacity + 1 - len(self.offsets), dtype=np.int64)])
+
+        if n_bytes > len(self.buffer):
+            capacity = max(n_bytes, 2 * len(self.buffer))
+            self.buffer = np.concatenate([self.buffer, np.zeros(capacity - len(self.buffer), dtype=np.uint8)])
+
+    def add(self, genome):
+        return(int(self.add_many([genome])[0]))
+
+    def add_many(self, genomes):
+
+        """
+        store genome strings. returns their ids
+        """
+
+        return(self.add_encoded(*encode_genomes(genomes)))
+
+    def add_encoded(self, buffer, offsets):
+
+        """
+        store genomes given as an ascii buffer and offsets (see mutation_engine.encode_genomes).
+        returns their ids
+        """
+
+        lengths = np.diff(offsets)
+        n_bytes = -(-lengths // 4)
+
+        # lay every genome out on its own run of whole bytes, then pack them all at once
+        padded_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(4 * n_bytes, out=padded_offsets[1:])
+
+        codes = np.zeros(padded_offsets[-1], dtype=np.uint8)
+        index = np.repeat(padded_offsets[:-1] - offsets[:-1], lengths) + np.arange(offsets[-1] - offsets[0]) + offsets[0]
+        codes[index] = to_codes(buffer[offsets[0]:offsets[-1]])
+        packed = pack_codes(codes)
+
+        start = self.offsets[self.n]
+        self.reserve(self.n + len(lengths), start + len(packed))
+
+        ids = np.arange(self.n, self.n + len(lengths))
+        self.buffer[start:start + len(packed)] = packed
+        self.lengths[ids] = lengths
+        self.offsets[ids + 1] = start + np.cumsum(n_bytes)
+        self.n += len(lengths)
+
+        return(ids)
+
+    def get(self, genome_id):
+        return(self.get_many([genome_id])[0])
+
+    def get_many(self, ids):
+
+        """
+        genome strings for a list of ids
+        """
+
+        return(decode_genomes(*self.get_encoded(ids)))
+
+    def get_encoded(self, ids):
+
+        """
+        ascii buffer and offsets for a list of ids, the input format of mutation_engine
+        """
+
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if len(ids) > 0 and (ids.min() < 0 or ids.max() >= self.n):
+            raise IndexError("genome id out of range")
+
+        packed = gather_segments(self.buffer, self.offsets[ids], self.offsets[ids + 1])
+        codes = unpack_codes(packed, 4 * len(packed))
+
+        # drop each genome's padding
+        lengths = self.lengths[ids]
+        packed_offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(4 * (self.offsets[ids + 1] - self.offsets[ids]), out=packed_offsets[1:])
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        index = np.repeat(packed_offsets[:-1] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return(symbols[codes[index]], offsets)
+
+    def __getitem__(self, genome_id):
+        return(self.get(genome_id))
+
+    def __len__(self):
+        return(self.n)
+
+    def nbytes(self):
+
+        """
+        memory in use by the stored genomes, not counting spare capacity
+        """
+
+        return(int(self.offsets[self.n]) + 16 * self.n)
+
+
+def functional_genomes(arena, ids):
+
+    """
+    functional genome of each id (see util.get_functional_genome)
+    """
+
+    return([get_functional_genome(g) for g in arena.get_many(ids)])
+
+
+def reduce_genomes(arena, ids, n_values=9):
+
+    """
+    reduced policy of each id, one row per genome (see genome_compiler.reduce_sequence)
+    """
+
+    coefficients = [reduce_sequence(f, n_values) for f in functional_genomes(arena, ids)]
+    return(np.array(coefficients, dtype=np.int64).reshape(len(coefficients), n_values))
+
+
+def mutate_arena(arena, parent_ids, spawn_number, mut_params):
+
+    """
+    mutate stored parents straight from the arena and store their children
+    (see mutation_engine.mutate_encoded). returns one array of child ids per parent
+    """
+
+    child_ids = arena.add_encoded(*mutate_encoded(*arena.get_encoded(parent_ids), spawn_number, mut_params))
+    return([child_ids[i:i + spawn_number] for i in range(0, len(child_ids), spawn_number)])
@@ -1,25 +1,52 @@
 import math
 import numpy as np
-from util import gradient_score
+from util import gradient_score, gradient_scores
+from genome_compiler import reduce_tree
 
 class genome_bot:
 
-    def __init__(self, name, gradient, weights, tree, pos=[0,0], twist=0):
+    def __init__(self, name, gradient, weights, tree, pos=[0,0], twist=0, log_level="full", max_steps=400):
 
         self.name = name
 
         self.sensor_angles = [(0. + twist) % 1, (1./3 + twist) % 1, (2./3 + twist) % 1]
         self.sensor_distances = [.1, .1, .1]
 
-        self.score = 0
+        # where each sensor sits relative to the bot. they turn with the bot's twist only
+        self.sensor_offsets = []
+        for i in range(len(self.sensor_angles)):
+            theta = self.sensor_angles[i] * 2 * math.pi
+            d = self.sensor_distances[i]
+            self.sensor_offsets.append((float(d * np.cos(theta)), float(d * np.sin(theta))))
+
         self.position = pos
         self.tree = tree
+        self.coefficients = reduce_tree(tree)
         self.gradient = gradient
         self.weights = weights
 
-        self.pos_log = {'x' : [self.position[0]],
-                        'y' : [self.position[1]],
-                        's' : [gradient_score(self.gradient, self.weights, self.position[0], self.position[1])]}
+        self.score = gradient_score(self.gradient, self.weights, self.position[0], self.position[1])
+
+        # running aggregates, kept at every log level (see score_summary)
+        self.steps = 0
+        self.start_score = self.score
+        self.max_score = self.score
+        self.score_sum = self.score
+
+        # "full" keeps x, y and score lists in pos_log
+        # "scores" keeps scores only, in an array preallocated for max_steps moves
+        # "none" keeps only the running aggregates
+        self.log_level = log_level
+        self.pos_log = None
+        self.score_log = None
+
+        if self.log_level == "full":
+            self.pos_log = {'x' : [self.position[0]],
+                            'y' : [self.position[1]],
+                            's' : [self.score]}
+        elif self.log_level == "scores":
+            self.score_log = np.empty(max_steps + 1)
+            self.score_log[0] = self.score
 
     def evaluate_tree(self, tree, values):
         """
@@ -49,22 +76,18 @@ class genome_bot:
     
     def get_move(self):
 
-        current_gradient_val = gradient_score(self.gradient, self.weights, self.position[0], self.position[1])
-        sensor_values = []
-
-        for i in range(len(self.sensor_angles)):
-            theta = self.sensor_angles[i] * 2 * math.pi
-            d = self.sensor_distances[i]
-
-            x = d * np.cos(theta) + self.position[0]
-            y = d * np.sin(theta) + self.position[1]
+        # the current position and the sensors, scored in one call
+        x, y = self.position
+        points = [[x, y]] + [[dx + x, dy + y] for dx, dy in self.sensor_offsets]
+        scores = gradient_scores(self.gradient, self.weights, points).tolist()
 
-            gradient_val = gradient_score(self.gradient, self.weights, x, y)
-            gradient_diff = gradient_val - current_gradient_val
-            sensor_values.append(gradient_diff)
+        current_gradient_val = scores[0]
+        sensor_values = [gradient_val - current_gradient_val for gradient_val in scores[1:]]
 
         values = self.sensor_angles + self.sensor_distances + sensor_values
-        rho = self.evaluate_tree(self.tree, values) * 2 * math.pi
+
+        # same value as self.evaluate_tree(self.tree, values), as one dot product
+        rho = (np.dot(self.coefficients, values) % 1) * 2 * math.pi
 
         move_x = .01 * np.cos(rho)
         move_y = .01 * np.sin(rho)
@@ -77,9 +100,31 @@ class genome_bot:
         new_x = self.position[0] + dx
         new_y = self.position[1] + dy
         self.position = [new_x, new_y]
-        self.pos_log['x'].append(new_x)
-        self.pos_log['y'].append(new_y)
-        self.pos_log['s'].append(gradient_score(self.gradient, self.weights, new_x, new_y))
+        self.score = gradient_score(self.gradient, self.weights, new_x, new_y)
+        self.steps += 1
+
+        self.max_score = max(self.max_score, self.score)
+        self.score_sum += self.score
+
+        if self.log_level == "full":
+            self.pos_log['x'].append(new_x)
+            self.pos_log['y'].append(new_y)
+            self.pos_log['s'].append(self.score)
+        elif self.log_level == "scores":
+            if len(self.score_log) <= self.steps:
+                self.score_log = np.concatenate([self.score_log, np.empty(len(self.score_log))])
+            self.score_log[self.steps] = self.score
+
+    def score_summary(self):
+
+        """
+        start, final, max and mean score over the bot's life
+        """
+
+        return({"start" : self.start_score,
+                "final" : self.score,
+                "max"   : self.max_score,
+                "mean"  : self.score_sum / (self.steps + 1)})
 
 
 
@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from util import get_functional_genome
+from genome_compiler import reduce_sequence, phenotype_key
+
+
+class genome_cache:
+
+    def __init__(self, max_entries=50000, max_bytes=None, resolve=None):
+
+        """
+        LRU cache of prepared genomes, keyed by raw genome. Parents carried over
+        between rounds are prepared once and then served from here.
+
+        max_entries - most genomes to keep
+        max_bytes - optional limit on the approximate memory held by the entries
+        resolve - optional function from key to raw genome, for caches keyed by
+                  genome id (see genome_registry)
+        """
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.resolve = resolve
+
+        self.entries = OrderedDict()
+        self.n_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def prepare(self, raw_genome):
+
+        """
+        everything the round needs from a raw genome
+            functional - the functional genome (see util.get_functional_genome)
+            coefficients - the reduced policy (see genome_compiler.reduce_sequence)
+            phenotype - hashable key shared by genomes with the same policy
+            length - length of the functional genome
+            raw_length - length of the raw genome
+        """
+
+        functional = get_functional_genome(raw_genome)
+        coefficients = reduce_sequence(functional)
+
+        entry = {
+            "functional"   : functional,
+            "coefficients" : coefficients,
+            "phenotype"    : phenotype_key(coefficients),
+            "length"       : len(functional),
+            "raw_length"   : len(raw_genome),
+        }
+        return(entry)
+
+    def entry_bytes(self, entry):
+        return(entry["raw_length"] + entry["length"] + entry["coefficients"].nbytes + 200)
+
+    def get(self, key):
+
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return(self.entries[key])
+
+        raw_genome = key
+        if self.resolve is not None:
+            raw_genome = self.resolve(key)
+
+        self.misses += 1
+        entry = self.prepare(raw_genome)
+        self.entries[key] = entry
+        self.n_bytes += self.entry_bytes(entry)
+        self.evict()
+        return(entry)
+
+    def evict(self):
+
+        """
+        drop least recently used entries until the cache is within its limits
+        """
+
+        while len(self.entries) > self.max_entries or \
+              (self.max_bytes is not None and self.n_bytes > self.max_bytes and len(self.entries) > 1):
+            key, entry = self.entries.popitem(last=False)
+            self.n_bytes -= self.entry_bytes(entry)
+            self.evictions += 1
+
+    def __len__(self):
+        return(len(self.entries))
+
+    def stats(self):
+        return({"entries"   : len(self.entries),
+                "bytes"     : self.n_bytes,
+                "hits"      : self.hits,
+                "misses"    : self.misses,
+                "evictions" : self.evictions})
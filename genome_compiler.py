@@ -0,0 +1,240 @@
+import numpy as np
+from util import get_functional_genome
+
+# opcodes
+LEAF = 0   # push values[arg] % 1
+NODE = 1   # pop arg values, push their sum % 1
+
+
+class genome_program:
+
+    def __init__(self, ops, args, n_values=9):
+
+        """
+        A genome tree flattened into postfix order.
+
+        ops - opcode per instruction (LEAF or NODE)
+        args - value slot for a LEAF, number of children for a NODE
+        n_values - length of the value vector the leaves index into
+        """
+
+        self.ops = np.array(ops, dtype=np.int8)
+        self.args = np.array(args, dtype=np.int64)
+        self.n_values = n_values
+
+    def __len__(self):
+        return(len(self.ops))
+
+
+def compile_tree(tree, n_values=9):
+
+    """
+    flatten a nested list tree (see util.sequence_to_tree) into a genome_program.
+    walks the tree with an explicit stack so depth is not limited by recursion
+    """
+
+    ops = []
+    args = []
+
+    # each entry is a node and the index of its next child to visit
+    stack = [[tree, 0]]
+    while stack:
+        node, child = stack[-1]
+
+        if type(node) == int:
+            ops.append(LEAF)
+            args.append(node % n_values)
+            stack.pop()
+        elif child < len(node):
+            stack[-1][1] += 1
+            stack.append([node[child], 0])
+        else:
+            ops.append(NODE)
+            args.append(len(node))
+            stack.pop()
+
+    return(genome_program(ops, args, n_values))
+
+
+def compile_sequence(s, n_values=9):
+
+    """
+    compile a genome string straight into a genome_program without building the tree.
+    gives the same program as compile_tree(sequence_to_tree(s)), including the parser's
+    handling of digits that come before a sublist and of unclosed lists
+
+    leaves are kept as binary value mod n_values, so long digit runs never become big ints
+    """
+
+    ops = []
+    args = []
+
+    # one frame per open list: [children so far, pending leaf value, pending digits seen]
+    frames = [[0, 0, False]]
+
+    for char in s:
+        if char == '0' or char == '1':
+            frame = frames[-1]
+            frame[1] = (frame[1] * 2 + int(char)) % n_values
+            frame[2] = True
+        elif char == '[':
+            frames.append([0, 0, False])
+        elif char == ']' or char == ',':
+            frame = frames[-1]
+            if frame[2]:
+                ops.append(LEAF)
+                args.append(frame[1])
+                frame[0] += 1
+                frame[1] = 0
+                frame[2] = False
+
+            if char == ']':
+                # a close at the top level ends parsing
+                if len(frames) == 1:
+                    break
+                frames.pop()
+                ops.append(NODE)
+                args.append(frame[0])
+                frames[-1][0] += 1
+
+    # lists left open at the end of the string are closed without their pending digits
+    while len(frames) > 1:
+        frame = frames.pop()
+        ops.append(NODE)
+        args.append(frame[0])
+        frames[-1][0] += 1
+
+    ops.append(NODE)
+    args.append(frames[0][0])
+
+    return(genome_program(ops, args, n_values))
+
+
+def evaluate_program(program, values):
+
+    """
+    evaluate a program against many value vectors at once
+
+    values - array with one row per value slot and one column per bot
+
+    returns one result per column, the same as genome_bot.evaluate_tree on each column
+    """
+
+    values = np.asarray(values, dtype=float)
+    stack = []
+
+    for op, arg in zip(program.ops.tolist(), program.args.tolist()):
+        if op == LEAF:
+            stack.append(values[arg] % 1)
+        else:
+            sum = 0
+            if arg:
+                children = stack[-arg:]
+                del stack[-arg:]
+                for c in children:
+                    sum += c
+            stack.append(sum % 1)
+
+    return(np.broadcast_to(stack[-1], values.shape[1:]).copy())
+
+
+def group_programs(programs):
+
+    """
+    group bot indices by program object. returns a list of (program, index array)
+    """
+
+    bots_by_program = {}
+    for i in range(len(programs)):
+        key = id(programs[i])
+        if not key in bots_by_program:
+            bots_by_program[key] = (programs[i], [])
+        bots_by_program[key][1].append(i)
+
+    return([(program, np.array(idx)) for program, idx in bots_by_program.values()])
+
+
+def evaluate_programs(programs, values, groups=None):
+
+    """
+    evaluate one program per bot
+
+    programs - list with one program per column of values. bots that share a
+               program object are evaluated together
+    values - array with one row per value slot and one column per bot
+    groups - optional output of group_programs(programs), to skip regrouping on every call
+    """
+
+    values = np.asarray(values, dtype=float)
+    results = np.zeros(values.shape[1])
+
+    if groups is None:
+        groups = group_programs(programs)
+
+    for program, idx in groups:
+        results[idx] = evaluate_program(program, values[:, idx])
+
+    return(results)
+
+
+def reduce_program(program):
+
+    """
+    reduce a program to its leaf count per value slot.
+
+    every node is the sum of its children mod 1, so the whole tree equals
+    (sum over k of c_k * values[k]) mod 1, where c_k is the number of leaves
+    that read value slot k
+    """
+
+    leaves = program.args[program.ops == LEAF]
+    return(np.bincount(leaves, minlength=program.n_values).astype(np.int64))
+
+
+def reduce_tree(tree, n_values=9):
+
+    """
+    coefficient vector of a parsed tree (see reduce_program)
+    """
+
+    return(reduce_program(compile_tree(tree, n_values)))
+
+
+def reduce_sequence(s, n_values=9):
+
+    """
+    coefficient vector of a functional genome string (see reduce_program)
+    """
+
+    return(reduce_program(compile_sequence(s, n_values)))
+
+
+def reduce_genome(raw_genome, n_values=9):
+
+    """
+    coefficient vector of a raw genome, through its functional genome
+    """
+
+    return(reduce_sequence(get_functional_genome(raw_genome), n_values))
+
+
+def evaluate_coefficients(coefficients, values):
+
+    """
+    evaluate reduced genomes as one dot product per bot
+
+    coefficients - one coefficient vector per bot, shape (bots, n_values)
+    values - array with one row per value slot and one column per bot
+    """
+
+    return(np.einsum('ij,ji->i', coefficients, values) % 1)
+
+
+def phenotype_key(coefficients):
+
+    """
+    hashable key shared by all genomes that reduce to the same policy, from
+    their coefficient vector (see reduce_genome)
+    """
+
+    return(tuple(coefficients.tolist()))
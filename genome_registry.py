@@ -0,0 +1,106 @@
+import hashlib
+from genome_arena import genome_arena
+
+
+def genome_key(genome):
+
+    """
+    16 byte content hash of a genome
+    """
+
+    return(hashlib.blake2b(genome.encode("ascii"), digest_size=16).digest())
+
+
+class genome_registry:
+
+    def __init__(self):
+
+        """
+        Gives every distinct genome a compact integer id for the life of a run.
+        Genomes are found by a 16 byte content hash, so registering the same
+        sequence again, e.g. a parent carried into the next round, returns the
+        same id. The round pipeline carries these ids and only looks genome
+        strings up where they are needed (mutation, leaderboard output).
+
+        The genomes themselves are held 2 bit packed in a genome_arena. Ids stay
+        the same when retain compacts the arena, so each id maps to its current
+        slot there.
+        """
+
+        self.id_by_key = {}
+        self.slots = {}     # id -> position in the arena
+        self.arena = genome_arena()
+        self.next_id = 0
+
+    def register(self, genome):
+        return(self.register_many([genome])[0])
+
+    def register_many(self, genomes):
+
+        """
+        ids for a list of genomes. new genomes are packed into the arena together
+        """
+
+        ids = []
+        new_ids = []
+        new_genomes = []
+
+        for genome in genomes:
+            key = genome_key(genome)
+            if key in self.id_by_key:
+                ids.append(self.id_by_key[key])
+                continue
+
+            genome_id = self.next_id
+            self.next_id += 1
+            self.id_by_key[key] = genome_id
+            ids.append(genome_id)
+            new_ids.append(genome_id)
+            new_genomes.append(genome)
+
+        if len(new_genomes) > 0:
+            positions = self.arena.add_many(new_genomes).tolist()
+            self.slots.update(zip(new_ids, positions))
+
+        return(ids)
+
+    def get(self, genome_id):
+        return(self.get_many([genome_id])[0])
+
+    def get_many(self, genome_ids):
+        return(self.arena.get_many([self.slots[i] for i in genome_ids]))
+
+    def retain(self, genome_ids):
+
+        """
+        forget every genome not in genome_ids and repack the arena with the rest.
+        ids are never reused, so ids that are kept stay valid and a forgotten
+        genome gets a new id if it comes back
+        """
+
+        keep = set(genome_ids)
+        kept_ids = [i for i in self.slots if i in keep]
+
+        arena = genome_arena(max(len(kept_ids), 1))
+        if len(kept_ids) > 0:
+            positions = arena.add_encoded(*self.arena.get_encoded([self.slots[i] for i in kept_ids])).tolist()
+        else:
+            positions = []
+
+        self.arena = arena
+        self.slots = dict(zip(kept_ids, positions))
+        self.id_by_key = {k : i for k, i in self.id_by_key.items() if i in keep}
+
+    def nbytes(self):
+
+        """
+        memory in use by the packed genomes (see genome_arena.nbytes)
+        """
+
+        return(self.arena.nbytes())
+
+    def __contains__(self, genome_id):
+        return(genome_id in self.slots)
+
+    def __len__(self):
+        return(len(self.slots))
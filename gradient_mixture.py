@@ -0,0 +1,285 @@
+import math
+import numpy as np
+
+# Catmull-Rom weight of each of the four grid values around a point (rows) as a
+# polynomial in its offset t into the cell, one column per power of t
+catmull_rom = np.array([[0., -0.5,  1.0, -0.5],
+                        [1.,  0.0, -2.5,  1.5],
+                        [0.,  0.5,  2.0, -1.5],
+                        [0.,  0.0, -0.5,  0.5]])
+
+# lists of up to this many points are scored one point at a time (see gradient_mixture.score_points)
+few_points = 8
+
+
+class gradient_mixture:
+
+    def __init__(self, gradient, weights):
+
+        """
+        Closed form evaluator for a weighted mixture of bivariate normals.
+        Means, inverse covariances and normalizers are computed once so that
+        scoring is a few array operations for any number of points.
+
+        inputs:
+        - gradient - a list of distribution objects (see evo_sim.define_gradient_and_weights)
+        - weights - a list of weights summing to one
+        """
+
+        self.means = np.array([np.asarray(g.mean, dtype=float) for g in gradient]).reshape(-1, 2)
+        covs = np.array([np.asarray(g.cov, dtype=float) for g in gradient]).reshape(-1, 2, 2)
+
+        self.inv_covs = np.linalg.inv(covs)
+
+        # weight / (2 pi sqrt(det(cov))) for each component
+        self.normalizers = np.array(weights, dtype=float) / (2 * math.pi * np.sqrt(np.linalg.det(covs)))
+
+        # the same values as python floats for score, which works on one point at a
+        # time and would spend more on numpy call overhead than on the arithmetic
+        self.components = [(float(m[0]), float(m[1]), float(inv[0, 0]), float(inv[0, 1]), float(inv[1, 0]), float(inv[1, 1]), float(n))
+                           for m, inv, n in zip(self.means, self.inv_covs, self.normalizers)]
+
+    def score(self, x, y):
+
+        """
+        return the mixture value at one point
+        """
+
+        score = 0.
+        for mx, my, a, b, c, d, n in self.components:
+            dx = x - mx
+            dy = y - my
+            score += n * math.exp(-0.5 * (dx * (a * dx + b * dy) + dy * (c * dx + d * dy)))
+        return(score)
+
+    def score_points(self, points):
+
+        """
+        return the mixture value at each point
+
+        points - array of positions, one [x, y] row per point. a short list, such
+                 as a bot's position and sensors, is scored point by point with score
+        """
+
+        if not isinstance(points, np.ndarray) and len(points) <= few_points:
+            return(np.array([self.score(x, y) for x, y in points]))
+        return(self.score_array(np.asarray(points, dtype=float).reshape(-1, 2)))
+
+    def score_array(self, points):
+
+        """
+        score_points for an n x 2 array, as a few array operations per component
+        """
+
+        scores = np.zeros(len(points))
+
+        for k in range(len(self.means)):
+            d = points - self.means[k]
+            inv = self.inv_covs[k]
+            maha = d[:, 0] * (inv[0, 0] * d[:, 0] + inv[0, 1] * d[:, 1]) + \
+                   d[:, 1] * (inv[1, 0] * d[:, 0] + inv[1, 1] * d[:, 1])
+            scores += self.normalizers[k] * np.exp(-0.5 * maha)
+
+        return(scores)
+
+
+class gradient_lattice(gradient_mixture):
+
+    def __init__(self, gradient, weights, x_range, y_range, step=0.01, margin=0.2, method="bilinear"):
+
+        """
+        Lookup table version of gradient_mixture. The mixture is sampled once on a
+        regular grid and queries are answered by interpolation. Points outside the
+        grid fall back to exact evaluation.
+
+        inputs:
+        - gradient, weights - as for gradient_mixture
+        - x_range, y_range - the area bots start in
+        - step - grid spacing
+        - margin - extra distance sampled past each edge, so sensors and bots
+          that drift out of the start area still hit the table
+        - method - "bilinear" or "bicubic"
+        """
+
+        super().__init__(gradient, weights)
+
+        if not method in ["bilinear", "bicubic"]:
+            raise ValueError(f"unknown interpolation method: {method}")
+
+        self.method = method
+        self.step = step
+
+        self.x0 = x_range[0] - margin
+        self.y0 = y_range[0] - margin
+        self.nx = int(math.ceil((x_range[1] + margin - self.x0) / step)) + 1
+        self.ny = int(math.ceil((y_range[1] + margin - self.y0) / step)) + 1
+
+        grid_x, grid_y = np.meshgrid(self.x0 + step * np.arange(self.nx), self.y0 + step * np.arange(self.ny))
+        points = np.stack([grid_x.ravel(), grid_y.ravel()], axis=1)
+
+        # one row per y value, one column per x value. score reads it as a python list
+        self.table = self.exact_score_points(points).reshape(self.ny, self.nx)
+        self.values = self.table.ravel().tolist()
+
+        # the polynomial of every cell, one row per term and one column per cell
+        if self.method == "bilinear":
+            self.coefficients = self.bilinear_coefficients()
+        else:
+            self.coefficients = self.bicubic_coefficients()
+
+    def bilinear_coefficients(self):
+
+        """
+        the bilinear patch of every cell as c[0] + c[1] * tx + c[2] * ty + c[3] * tx * ty.
+        column j * (nx - 1) + i holds cell (i, j)
+        """
+
+        t = self.table
+        coefficients = np.stack([t[:-1, :-1],
+                                 t[:-1, 1:] - t[:-1, :-1],
+                                 t[1:, :-1] - t[:-1, :-1],
+                                 t[1:, 1:] - t[1:, :-1] - t[:-1, 1:] + t[:-1, :-1]])
+        return(np.ascontiguousarray(coefficients.reshape(4, -1)))
+
+    def bicubic_coefficients(self):
+
+        """
+        the bicubic patch of every cell as 16 polynomial coefficients, so a lookup
+        is a polynomial instead of 16 table reads. column (j - 1) * (nx - 3) + (i - 1)
+        holds cell (i, j), and row 4 * k + l the coefficient of ty**k * tx**l
+        """
+
+        stencils = np.lib.stride_tricks.sliding_window_view(self.table, (4, 4))
+        coefficients = np.einsum("ak,jiab,bl->klji", catmull_rom, stencils, catmull_rom)
+        return(np.ascontiguousarray(coefficients.reshape(16, -1)))
+
+    def exact_score_points(self, points):
+        return(gradient_mixture.score_array(self, np.asarray(points, dtype=float).reshape(-1, 2)))
+
+    def score(self, x, y):
+
+        """
+        return the interpolated mixture value at one point, in plain python
+        """
+
+        fx = (x - self.x0) / self.step
+        fy = (y - self.y0) / self.step
+        i = math.floor(fx)
+        j = math.floor(fy)
+
+        pad = 1 if self.method == "bicubic" else 0
+        if not (pad <= i < self.nx - 1 - pad and pad <= j < self.ny - 1 - pad):
+            return(gradient_mixture.score(self, x, y))
+
+        tx = fx - i
+        ty = fy - j
+
+        if self.method == "bilinear":
+            t = self.values
+            k = j * self.nx + i
+            t00, t01, t10, t11 = t[k], t[k + 1], t[k + self.nx], t[k + self.nx + 1]
+            return(t00 + tx * ((t01 - t00) + ty * (t11 - t10 - t01 + t00)) + ty * (t10 - t00))
+
+        c = self.coefficients[:, (j - 1) * (self.nx - 3) + (i - 1)].tolist()
+        rows = [((c[4 * k + 3] * tx + c[4 * k + 2]) * tx + c[4 * k + 1]) * tx + c[4 * k] for k in range(4)]
+        return(((rows[3] * ty + rows[2]) * ty + rows[1]) * ty + rows[0])
+
+    def score_array(self, points):
+
+        """
+        return the interpolated mixture value at each row of an n x 2 array
+        """
+
+        # the lookup works in place where it can. a population's worth of points
+        # makes every temporary a fresh mmap, and page faults on those cost more
+        # than the arithmetic
+        fx = points[:, 0] - self.x0
+        fx /= self.step
+        fy = points[:, 1] - self.y0
+        fy /= self.step
+        i = np.floor(fx)
+        j = np.floor(fy)
+
+        # usually every point's whole interpolation stencil lies in the table,
+        # which the bounds show without a mask or any reindexing
+        pad = 1 if self.method == "bicubic" else 0
+        if len(points) == 0 or (i.min() >= pad and i.max() < self.nx - 1 - pad and j.min() >= pad and j.max() < self.ny - 1 - pad):
+            fx -= i
+            fy -= j
+            return(self.interpolate(i, j, fx, fy))
+
+        inside = (i >= pad) & (i < self.nx - 1 - pad) & (j >= pad) & (j < self.ny - 1 - pad)
+        scores = np.empty(len(points))
+        outside = ~inside
+        scores[outside] = self.exact_score_points(points[outside])
+
+        i, j = i[inside], j[inside]
+        scores[inside] = self.interpolate(i, j, fx[inside] - i, fy[inside] - j)
+        return(scores)
+
+    def interpolate(self, i, j, tx, ty):
+
+        """
+        interpolated values in cells (i, j), at offsets (tx, ty) into each cell.
+        the cell indices come as floats and every stencil must lie in the table
+        """
+
+        # one flat cell index per point, then one contiguous take per coefficient
+        if self.method == "bilinear":
+            cells = j * (self.nx - 1)
+            cells += i
+        else:
+            cells = j - 1
+            cells *= self.nx - 3
+            cells += i
+            cells -= 1
+        cells = cells.astype(np.intp)
+        c = self.coefficients
+
+        if self.method == "bilinear":
+            scores = c[3].take(cells)
+            scores *= ty
+            scores += c[1].take(cells)
+            scores *= tx
+            term = c[2].take(cells)
+            term *= ty
+            scores += term
+            scores += c[0].take(cells)
+            return(scores)
+
+        # horner in tx for each power of ty, then in ty
+        scores = None
+        for k in range(3, -1, -1):
+            row = c[4 * k + 3].take(cells)
+            for l in range(2, -1, -1):
+                row *= tx
+                row += c[4 * k + l].take(cells)
+
+            if scores is None:
+                scores = row
+            else:
+                scores *= ty
+                scores += row
+        return(scores)
+
+    def max_error(self, samples=100000, seed=0):
+
+        """
+        return the largest absolute difference between interpolated and exact values
+        over random points and cell centers inside the table. uses its own random
+        state so the simulation's random streams are not touched
+        """
+
+        rng = np.random.RandomState(seed)
+
+        x1 = self.x0 + self.step * (self.nx - 1)
+        y1 = self.y0 + self.step * (self.ny - 1)
+        random_points = np.stack([rng.uniform(self.x0, x1, samples), rng.uniform(self.y0, y1, samples)], axis=1)
+
+        # cell centers are the worst case for bilinear interpolation
+        ci = rng.randint(0, self.nx - 1, samples)
+        cj = rng.randint(0, self.ny - 1, samples)
+        centers = np.stack([self.x0 + self.step * (ci + .5), self.y0 + self.step * (cj + .5)], axis=1)
+
+        points = np.concatenate([random_points, centers])
+        return(float(np.max(np.abs(self.score_points(points) - self.exact_score_points(points)))))
@@ -0,0 +1,167 @@
+import os
+import numpy as np
+from collections import deque
+from util import atomic_write
+
+
+class leaderboard_log:
+
+    def __init__(self, path, keep=50):
+
+        """
+        Append only log of one text block per round. Each append writes only the
+        new block, and a sidecar index of (round, offset, length) records lets any
+        round be read back with one seek. The last keep blocks are also held in
+        memory for a small "current" view.
+
+        path - log file. the index goes next to it, in path + ".idx"
+        keep - rounds in the current view
+        """
+
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.keep = keep
+
+        self.recover()
+
+        self.log = open(self.path, "ab")
+        self.index = open(self.index_path, "ab")
+
+        self.recent = deque(maxlen=keep)
+        self.last_round = None
+        self.load_recent()
+
+    def read_index(self):
+
+        """
+        index records with one (round, offset, length) row per block. the file is
+        memory mapped, so lookups only read the pages they touch
+        """
+
+        n = 0
+        if os.path.exists(self.index_path):
+            n = os.path.getsize(self.index_path) // 24
+
+        if n == 0:
+            return(np.zeros((0, 3), dtype=np.int64))
+        return(np.memmap(self.index_path, dtype="<i8", mode="r", shape=(n, 3)))
+
+    def recover(self):
+
+        """
+        make the log and index agree after a crash. blocks are written before their
+        index record, so a partial index record or an unindexed tail of the log is dropped
+        """
+
+        records = self.read_index()
+
+        log_size = 0
+        if os.path.exists(self.path):
+            log_size = os.path.getsize(self.path)
+
+        # offsets only grow, so only the last block that starts inside the log can be cut short
+        n = int(np.searchsorted(records[:, 1], log_size, side="right"))
+        if n > 0 and records[n - 1, 1] + records[n - 1, 2] > log_size:
+            n -= 1
+
+        self.truncate_files(records, n)
+
+    def truncate_files(self, records, n):
+
+        """
+        keep the first n index records and the blocks they point to
+        """
+
+        end = 0
+        if n > 0:
+            end = int(records[n - 1, 1] + records[n - 1, 2])
+
+        with open(self.path, "ab") as f:
+            f.truncate(end)
+        with open(self.index_path, "ab") as f:
+            f.truncate(24 * n)
+
+    def load_recent(self):
+        records = self.read_index()
+        for round_num, offset, length in records[-self.keep:].tolist():
+            self.recent.append((round_num, self.read_block(offset, length)))
+
+        self.last_round = None
+        if len(records) > 0:
+            self.last_round = int(records[-1, 0])
+
+    def read_block(self, offset, length):
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return(f.read(length).decode("utf-8"))
+
+    def append(self, round_num, text):
+
+        """
+        add the block for one round. rounds must come in increasing order, since
+        read_round searches the index by round. a run started over on an old log
+        has to truncate_after(-1) first
+        """
+
+        if self.last_round is not None and round_num <= self.last_round:
+            raise ValueError(f"round {round_num} is not after the last logged round {self.last_round}")
+
+        data = text.encode("utf-8")
+        offset = self.log.tell()
+
+        self.log.write(data)
+        self.log.flush()
+
+        self.index.write(np.array([round_num, offset, len(data)], dtype="<i8").tobytes())
+        self.index.flush()
+
+        self.recent.append((round_num, text))
+        self.last_round = round_num
+
+    def read_round(self, round_num):
+
+        """
+        the block logged for a round, or None if it isn't in the log
+        """
+
+        self.log.flush()
+        records = self.read_index()
+
+        i = int(np.searchsorted(records[:, 0], round_num))
+        if i == len(records) or records[i, 0] != round_num:
+            return(None)
+        return(self.read_block(int(records[i, 1]), int(records[i, 2])))
+
+    def truncate_after(self, round_num):
+
+        """
+        drop every block after round_num, e.g. when resuming from a checkpoint
+        taken at that round. truncate_after(-1) empties the log for a fresh run
+        """
+
+        self.log.close()
+        self.index.close()
+
+        records = self.read_index()
+        self.truncate_files(records, int(np.searchsorted(records[:, 0], round_num, side="right")))
+
+        self.log = open(self.path, "ab")
+        self.index = open(self.index_path, "ab")
+
+        self.recent.clear()
+        self.load_recent()
+
+    def write_current(self, path):
+
+        """
+        write the last keep rounds to path. the file is replaced in one step so
+        readers never see it half written
+        """
+
+        with atomic_write(path) as f:
+            for round_num, text in self.recent:
+                f.write(text)
+
+    def close(self):
+        self.log.close()
+        self.index.close()
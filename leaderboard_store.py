@@ -0,0 +1,105 @@
+import json
+import sqlite3
+from genome_registry import genome_key
+
+
+class leaderboard_store:
+
+    def __init__(self, path, commit_every=100):
+
+        """
+        On disk history for a leaderboard, in sqlite. Holds the leaders of every
+        round and the name of every genome that ever placed, so the leaderboard
+        itself only keeps a bounded window in memory.
+
+        path - database file
+        commit_every - rounds between commits. commit() forces one, e.g. before a checkpoint
+        """
+
+        self.path = path
+        self.commit_every = commit_every
+        self.pending = 0
+
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS rounds (round INTEGER PRIMARY KEY, leaders TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS names (genome_key BLOB PRIMARY KEY, genome TEXT, name TEXT, round INTEGER)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS names_by_round ON names (round)")
+        self.db.commit()
+
+    def put_round(self, round_num, round_data):
+
+        """
+        store the leaders of a round (see leaderboard.add_round)
+        """
+
+        self.db.execute("INSERT OR REPLACE INTO rounds VALUES (?, ?)", (round_num, json.dumps(round_data)))
+
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    def get_round(self, round_num):
+
+        """
+        leaders of a round, or None if the round isn't stored
+        """
+
+        row = self.db.execute("SELECT leaders FROM rounds WHERE round = ?", (round_num,)).fetchone()
+        if row is None:
+            return(None)
+        return(json.loads(row[0]))
+
+    def put_name(self, genome, name, round_num):
+        self.db.execute("INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?)", (genome_key(genome), genome, name, round_num))
+
+    def get_name(self, genome):
+
+        """
+        name given to a genome when it first placed, or None
+        """
+
+        row = self.db.execute("SELECT genome, name FROM names WHERE genome_key = ?", (genome_key(genome),)).fetchone()
+        if row is None or row[0] != genome:
+            return(None)
+        return(row[1])
+
+    def get_genomes(self, round_num):
+
+        """
+        genomes first named in a round, as a dict of genome -> name
+        """
+
+        rows = self.db.execute("SELECT genome, name FROM names WHERE round = ?", (round_num,)).fetchall()
+        return(dict(rows))
+
+    def get_names(self):
+
+        """
+        (genome, name) for every stored name, in the order they were given
+        """
+
+        return(self.db.execute("SELECT genome, name FROM names ORDER BY round, rowid").fetchall())
+
+    def truncate_after(self, round_num):
+
+        """
+        drop rounds, and names first given, after round_num. used when resuming
+        from a checkpoint. truncate_after(-1) empties the store for a fresh run
+        """
+
+        self.db.execute("DELETE FROM rounds WHERE round > ?", (round_num,))
+        self.db.execute("DELETE FROM names WHERE round > ?", (round_num,))
+        self.commit()
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def __len__(self):
+        return(self.db.execute("SELECT COUNT(*) FROM rounds").fetchone()[0])
+
+    def close(self):
+        if self.db is not None:
+            self.commit()
+            self.db.close()
+            self.db = None
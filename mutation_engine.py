@@ -0,0 +1,205 @@
+import numpy as np
+
+# genome symbols, in the order spawner.add_point_mut draws them from
+alphabet = np.frombuffer(b'[]10', dtype=np.uint8)
+
+
+def encode_genomes(genomes):
+
+    """
+    pack genome strings into one uint8 buffer
+
+    returns the buffer and an offsets array, genome i is buffer[offsets[i]:offsets[i + 1]]
+    """
+
+    lengths = np.array([len(g) for g in genomes], dtype=np.int64)
+    offsets = np.zeros(len(genomes) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    buffer = np.frombuffer("".join(genomes).encode("ascii"), dtype=np.uint8).copy()
+    return(buffer, offsets)
+
+
+def decode_genomes(buffer, offsets):
+
+    """
+    genome strings back out of a buffer and offsets (see encode_genomes)
+    """
+
+    s = buffer.tobytes().decode("ascii")
+    offsets = offsets.tolist()
+    return([s[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)])
+
+
+def gather_segments(buffer, starts, ends):
+
+    """
+    concatenate buffer[starts[i]:ends[i]] for every i, without a python loop
+    """
+
+    lengths = np.maximum(ends - starts, 0)
+    total = int(lengths.sum())
+
+    # position k of the output reads buffer[starts[i] + k - (output start of segment i)]
+    out_starts = np.cumsum(lengths) - lengths
+    index = np.repeat(starts - out_starts, lengths) + np.arange(total)
+    return(buffer[index])
+
+
+def slice_bound(bound, length):
+
+    """
+    where a python slice bound lands in a sequence of the given length.
+    negative bounds count from the end, the same as string slicing
+    """
+
+    bound = np.where(bound < 0, bound + length, bound)
+    return(np.clip(bound, 0, length))
+
+
+def tandem_dupes(buffer, offsets, apply, avg_seg_len, var_seg_len):
+
+    """
+    duplicate a random segment in every genome where apply is set, the same
+    way as spawner.tandem_dupe, including its slicing of negative bounds
+
+    returns the new buffer and offsets
+    """
+
+    n = len(offsets) - 1
+    lengths = np.diff(offsets)
+
+    # draws are only made for the genomes that mutate
+    k = int(apply.sum())
+    pos = np.trunc(lengths[apply] * np.random.random(k))
+    size = np.trunc(np.random.normal(avg_seg_len, var_seg_len, k))
+
+    left = lengths.copy()
+    right = lengths.copy()
+    left[apply] = np.maximum(0, np.trunc(pos - size / 2)).astype(np.int64)
+    right[apply] = np.minimum(np.trunc(pos + size / 2), lengths[apply] - 1).astype(np.int64)
+
+    left = slice_bound(left, lengths)
+    right = slice_bound(right, lengths)
+    dupe_end = np.maximum(left, right)
+
+    # genome[:left] + genome[left:right] * 2 + genome[right:], as four segments per genome
+    base = offsets[:-1]
+    starts = np.stack([base, base + left, base + left, base + right], axis=1).ravel()
+    ends = np.stack([base + left, base + dupe_end, base + dupe_end, base + lengths], axis=1).ravel()
+
+    new_lengths = left + 2 * (dupe_end - left) + (lengths - right)
+    new_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(new_lengths, out=new_offsets[1:])
+
+    return(gather_segments(buffer, starts, ends), new_offsets)
+
+
+def add_point_muts(buffer, offsets, point_mut_per_genome):
+
+    """
+    replace symbols in place with random ones from the alphabet. each symbol of a
+    genome mutates with probability point_mut_per_genome / len(genome), as in
+    spawner.add_point_mut. the number of mutations per genome is drawn as one
+    binomial and their positions are drawn without replacement
+    """
+
+    lengths = np.diff(offsets)
+    p = np.zeros(len(lengths))
+    nonempty = lengths > 0
+    p[nonempty] = np.minimum(point_mut_per_genome / lengths[nonempty], 1.)
+
+    counts = np.random.binomial(lengths, p)
+    genome_of = np.repeat(np.arange(len(lengths)), counts)
+    positions = offsets[:-1][genome_of] + np.trunc(np.random.random(len(genome_of)) * lengths[genome_of]).astype(np.int64)
+
+    # redraw repeated positions until every genome has distinct ones
+    while True:
+        _, first = np.unique(positions, return_index=True)
+        repeated = np.ones(len(positions), dtype=bool)
+        repeated[first] = False
+        if not repeated.any():
+            break
+        g = genome_of[repeated]
+        positions[repeated] = offsets[:-1][g] + np.trunc(np.random.random(len(g)) * lengths[g]).astype(np.int64)
+
+    buffer[positions] = alphabet[np.random.randint(0, len(alphabet), len(positions))]
+    return(buffer)
+
+
+def mutate_buffer(buffer, offsets, mut_params):
+
+    """
+    apply one round of mutations to every genome in a buffer. returns the new buffer and offsets
+    """
+
+    n = len(offsets) - 1
+
+    dupe = np.random.random(n) < mut_params["p_tandem_dupe"]
+    buffer, offsets = tandem_dupes(buffer, offsets, dupe, mut_params["avg_seg_len"], mut_params["var_seg_len"])
+
+    # spawner.mutate applies a second tandem dupe, not a deletion, with p_del
+    dupe = np.random.random(n) < mut_params["p_del"]
+    buffer, offsets = tandem_dupes(buffer, offsets, dupe, mut_params["avg_seg_len"], mut_params["var_seg_len"])
+
+    buffer = add_point_muts(buffer, offsets, mut_params["point_mut"])
+    return(buffer, offsets)
+
+
+def mutate_encoded(parent_buffer, parent_offsets, spawn_number, mut_params):
+
+    """
+    make spawn_number distinct mutated children for every parent in one batched call.
+    children that repeat one already made for the same parent are redrawn, like the
+    loop in spawner.mutate
+
+    parent_buffer, parent_offsets - the parents, as from encode_genomes
+
+    returns the children as a buffer and offsets, spawn_number per parent in parent order
+    """
+
+    n_parents = len(parent_offsets) - 1
+    children = [[] for p in range(n_parents)]
+    seen = [set() for p in range(n_parents)]
+    needed = np.full(n_parents, spawn_number, dtype=np.int64)
+
+    while needed.sum() > 0:
+        parent_ids = np.repeat(np.arange(n_parents), needed)
+
+        # copy each parent once per child still needed
+        buffer = gather_segments(parent_buffer, parent_offsets[parent_ids], parent_offsets[parent_ids + 1])
+        lengths = parent_offsets[parent_ids + 1] - parent_offsets[parent_ids]
+        offsets = np.zeros(len(parent_ids) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        buffer, offsets = mutate_buffer(buffer, offsets, mut_params)
+
+        raw = buffer.tobytes()
+        offsets = offsets.tolist()
+        for i, p in enumerate(parent_ids.tolist()):
+            child = raw[offsets[i]:offsets[i + 1]]
+            if not child in seen[p] and len(children[p]) < spawn_number:
+                seen[p].add(child)
+                children[p].append(child)
+
+        needed = spawn_number - np.array([len(c) for c in children], dtype=np.int64)
+
+    children = [child for c in children for child in c]
+    lengths = np.array([len(child) for child in children], dtype=np.int64)
+    offsets = np.zeros(len(children) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    return(np.frombuffer(b"".join(children), dtype=np.uint8).copy(), offsets)
+
+
+def mutate_genomes(parent_genomes, spawn_number, mut_params):
+
+    """
+    string version of mutate_encoded. returns one list of children per parent,
+    in the order they were made
+    """
+
+    buffer, offsets = mutate_encoded(*encode_genomes(parent_genomes), spawn_number, mut_params)
+    children = decode_genomes(buffer, offsets)
+
+    return([children[i:i + spawn_number] for i in range(0, len(children), spawn_number)])
@@ -1,4 +1,5 @@
 import json
+from util import get_functional_genome
 
 class organism:
 
@@ -51,46 +52,7 @@ class organism:
         get the largest fully enclosed sublist
         """
 
-        if not coords[1] - coords[0] > 1 or coords[1] > len(sequence):
-            return('[]')
-
-        rough_subseq = '[' + sequence[coords[0]:coords[1]] + ']'              
-        stack_heights = {}  # track running differences of opens and closes
-        substr_ends   = {}  # track the index where each stack becomes empty
-
-        # iterate over the sequences, updating each potential subsequence
-        for i in range(len(rough_subseq)):
-
-            # create a new potential start for an open bracket
-            if rough_subseq[i] == '[':
-                stack_heights[i] = 0
-
-            # update existing stacks
-            for h in stack_heights:
-                to_remove = []
-
-                # If the current character is an open bracket 
-                if rough_subseq[i] == '[':  
-                    stack_heights[h] += 1
-
-                # If the current character is an close bracket
-                if rough_subseq[i] == ']':
-                    stack_heights[h] -= 1
-                    if stack_heights[h] == 0:
-                        to_remove.append(h)
-                        substr_ends[h] = i + 1
-
-            # clean up finished stacks
-            for h in to_remove:
-                stack_heights.pop(h, None)
-
-        max_len = 0
-        max_len_substr = ''
-        for s in substr_ends:
-            if max_len < substr_ends[s] - s:
-                max_len = substr_ends[s] - s
-                max_len_substr = rough_subseq[s:substr_ends[s]]
-        return(max_len_substr)
+        return(get_functional_genome(sequence, coords))
 
 
     def get_move(self):
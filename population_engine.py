@@ -0,0 +1,191 @@
+import math
+import numpy as np
+from util import gradient_scores
+from genome_compiler import evaluate_coefficients
+
+
+class finished_bot:
+
+    def __init__(self, name, pos_log, summary):
+
+        """
+        stand-in for a genome_bot after its run. carries only what
+        summarize_run and the visualizer read from a bot
+
+        pos_log - None unless the engine ran with log_level "full"
+        """
+
+        self.name = name
+        self.pos_log = pos_log
+        self.summary = summary
+
+    def score_summary(self):
+        return(self.summary)
+
+    def __str__(self):
+        return(self.name)
+
+
+class population_engine:
+
+    def __init__(self, gradient, weights, coefficients, positions, twists, names=None, log_level="full"):
+
+        """
+        Simulate a whole population of genome bots with numpy arrays. Every call
+        to make_move advances all bots one step.
+
+        gradient, weights - gradient definition, as from evo_sim.define_gradient_and_weights
+        coefficients - one reduced genome per bot, shape (bots, 9) (see genome_compiler.reduce_genome)
+        positions - one starting [x, y] per bot
+        twists - one sensor rotation per bot (see genome_bot)
+        names - optional bot names, used for the finished bot records
+        log_level - "full" keeps x, y and score histories
+                    "scores" keeps only the score history, in a preallocated array
+                    "none" keeps only the running score aggregates
+        """
+
+        if not log_level in ["full", "scores", "none"]:
+            raise ValueError(f"unknown log level: {log_level}")
+
+        self.gradient = gradient
+        self.weights = weights
+        self.log_level = log_level
+
+        self.n = len(coefficients)
+        self.names = names
+        if self.names is None:
+            self.names = [f"b_{i}" for i in range(self.n)]
+
+        self.positions = np.array(positions, dtype=float).reshape(self.n, 2)
+        self.twists = np.array(twists, dtype=float)
+
+        self.sensor_angles = (np.array([0., 1./3, 2./3])[:, None] + self.twists) % 1
+        self.sensor_distances = np.full((3, self.n), .1)
+
+        self.coefficients = np.array(coefficients, dtype=float).reshape(self.n, -1)
+
+        self.steps = 0
+        self.scores = gradient_scores(self.gradient, self.weights, self.positions)
+
+        # running aggregates, kept at every log level
+        self.start_scores = self.scores
+        self.max_scores = self.scores.copy()
+        self.score_sums = self.scores.copy()
+
+        if self.log_level == "full":
+            self.log_x = [self.positions[:, 0].copy()]
+            self.log_y = [self.positions[:, 1].copy()]
+            self.log_s = [self.scores]
+        elif self.log_level == "scores":
+            self.score_log = np.empty((1, self.n))
+            self.score_log[0] = self.scores
+
+    def reserve(self, steps):
+
+        """
+        make room in the score log for this many steps in total
+        """
+
+        if self.log_level == "scores" and len(self.score_log) < steps + 1:
+            score_log = np.empty((steps + 1, self.n))
+            score_log[:self.steps + 1] = self.score_log[:self.steps + 1]
+            self.score_log = score_log
+
+    def get_moves(self):
+
+        """
+        return dx, dy arrays for every bot, following genome_bot.get_move
+        """
+
+        theta = self.sensor_angles * 2 * math.pi
+        x = self.sensor_distances * np.cos(theta) + self.positions[:, 0]
+        y = self.sensor_distances * np.sin(theta) + self.positions[:, 1]
+
+        sensor_points = np.stack([x.ravel(), y.ravel()], axis=1)
+        sensor_values = gradient_scores(self.gradient, self.weights, sensor_points).reshape(3, self.n)
+        sensor_values = sensor_values - self.scores
+
+        values = np.concatenate([self.sensor_angles, self.sensor_distances, sensor_values])
+
+        rho = evaluate_coefficients(self.coefficients, values) * 2 * math.pi
+
+        move_x = .01 * np.cos(rho)
+        move_y = .01 * np.sin(rho)
+        return(move_x, move_y)
+
+    def make_move(self):
+
+        dx, dy = self.get_moves()
+
+        self.positions = self.positions + np.stack([dx, dy], axis=1)
+        self.scores = gradient_scores(self.gradient, self.weights, self.positions)
+        self.steps += 1
+
+        np.maximum(self.max_scores, self.scores, out=self.max_scores)
+        self.score_sums += self.scores
+
+        if self.log_level == "full":
+            self.log_x.append(self.positions[:, 0].copy())
+            self.log_y.append(self.positions[:, 1].copy())
+            self.log_s.append(self.scores)
+        elif self.log_level == "scores":
+            if len(self.score_log) <= self.steps:
+                self.reserve(2 * self.steps)
+            self.score_log[self.steps] = self.scores
+
+    def run(self, iterations):
+        self.reserve(self.steps + iterations)
+        for i in range(iterations):
+            self.make_move()
+
+    def get_score_log(self):
+
+        """
+        score history, one row per step and one column per bot. not kept with log_level "none"
+        """
+
+        if self.log_level == "full":
+            return(np.stack(self.log_s))
+        return(self.score_log[:self.steps + 1])
+
+    def get_pos_logs(self):
+
+        """
+        return one pos_log dict per bot, in the same format as genome_bot.pos_log.
+        only kept with log_level "full"
+        """
+
+        log_x = np.stack(self.log_x, axis=1)
+        log_y = np.stack(self.log_y, axis=1)
+        log_s = np.stack(self.log_s, axis=1)
+
+        pos_logs = []
+        for i in range(self.n):
+            pos_logs.append({'x' : log_x[i].tolist(),
+                             'y' : log_y[i].tolist(),
+                             's' : log_s[i].tolist()})
+        return(pos_logs)
+
+    def finished_bots(self):
+
+        pos_logs = [None] * self.n
+        if self.log_level == "full":
+            pos_logs = self.get_pos_logs()
+
+        summaries = self.get_score_summaries()
+        bots = []
+        for i in range(self.n):
+            summary = {k : float(summaries[k][i]) for k in summaries}
+            bots.append(finished_bot(self.names[i], pos_logs[i], summary))
+        return(bots)
+
+    def get_score_summaries(self):
+
+        """
+        start, final, max and mean score of every bot, as arrays
+        """
+
+        return({"start" : self.start_scores,
+                "final" : self.scores,
+                "max"   : self.max_scores,
+                "mean"  : self.score_sums / (self.steps + 1)})
@@ -0,0 +1,216 @@
+import json
+import time
+from multiprocessing.reduction import ForkingPickler
+from util import atomic_write
+
+
+class null_phase:
+
+    """
+    stands in for a phase timer when metrics are off
+    """
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return(False)
+
+
+no_phase = null_phase()
+
+
+class phase_timer:
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.add_phase(self.name, time.perf_counter() - self.wall, time.process_time() - self.cpu)
+        return(False)
+
+
+def ipc_bytes(obj):
+
+    """
+    size of obj as a Pool sends it between processes
+    """
+
+    return(len(ForkingPickler.dumps(obj)))
+
+
+class round_metrics:
+
+    def __init__(self, path=None, prometheus_path=None, prefix="organism"):
+
+        """
+        Per round timings and counters. Code marks its phases with
+
+            with metrics.phase("simulate"):
+                ...
+
+        and adds counts with metrics.add. A round's record collects everything
+        from start_round until the next start_round or close, so work done after
+        run_round returns (leaderboard, checkpoints) lands in the same round.
+        Finished rounds are appended to path as one json line each, and the last
+        one is written to prometheus_path in the node exporter textfile format.
+
+        With neither path set, metrics are off: phase returns a shared no-op
+        context and add returns at once.
+
+        path - jsonl file to append rounds to
+        prometheus_path - optional .prom file, replaced every round
+        prefix - prometheus metric name prefix
+        """
+
+        self.path = path
+        self.prometheus_path = prometheus_path
+        self.prefix = prefix
+        self.enabled = path is not None or prometheus_path is not None
+
+        self.current = None
+        self.rounds = 0
+
+    def start_round(self, round_number):
+
+        if not self.enabled:
+            return
+
+        self.finish_round()
+        self.current = {"round"      : round_number,
+                        "start"      : time.time(),
+                        "start_wall" : time.perf_counter(),
+                        "start_cpu"  : time.process_time(),
+                        "end_wall"   : time.perf_counter(),
+                        "end_cpu"    : time.process_time(),
+                        "phases"     : {},
+                        "counters"   : {}}
+
+    def phase(self, name):
+
+        """
+        context manager timing one phase. a phase entered more than once in a
+        round adds up. dotted names (e.g. "simulate.workers") mark phases that
+        run inside another one
+        """
+
+        if self.current is None:
+            return(no_phase)
+        return(phase_timer(self, name))
+
+    def add_phase(self, name, wall, cpu):
+
+        phases = self.current["phases"]
+        if not name in phases:
+            phases[name] = {"wall_seconds" : 0., "cpu_seconds" : 0., "calls" : 0}
+        phases[name]["wall_seconds"] += wall
+        phases[name]["cpu_seconds"] += cpu
+        phases[name]["calls"] += 1
+
+        self.current["end_wall"] = time.perf_counter()
+        self.current["end_cpu"] = time.process_time()
+
+    def add(self, name, value):
+
+        """
+        add to a counter of the current round, e.g. bots or ipc_sent_bytes
+        """
+
+        if self.current is None:
+            return
+
+        counters = self.current["counters"]
+        counters[name] = counters.get(name, 0) + value
+
+    def record(self):
+
+        """
+        the current round as written to the jsonl file
+        """
+
+        current = self.current
+        counters = current["counters"]
+
+        record = {"round"        : current["round"],
+                  "time"         : current["start"],
+                  "wall_seconds" : current["end_wall"] - current["start_wall"],
+                  "cpu_seconds"  : current["end_cpu"] - current["start_cpu"],
+                  "phases"       : current["phases"]}
+        record.update(counters)
+
+        # simulation rate over the wall time of the simulate phase
+        record["bot_steps_per_second"] = None
+        simulate = current["phases"].get("simulate")
+        if simulate is not None and simulate["wall_seconds"] > 0 and "bot_steps" in counters:
+            record["bot_steps_per_second"] = counters["bot_steps"] / simulate["wall_seconds"]
+
+        return(record)
+
+    def finish_round(self):
+
+        """
+        write out the current round, if there is one
+        """
+
+        if self.current is None:
+            return
+
+        record = self.record()
+        self.current = None
+        self.rounds += 1
+
+        if self.path is not None:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+        if self.prometheus_path is not None:
+            self.write_prometheus(record)
+
+    def write_prometheus(self, record):
+
+        """
+        write a round as a node exporter textfile. the file is replaced in one
+        step so the exporter never reads it half written
+        """
+
+        p = self.prefix
+        lines = []
+
+        def metric(name, help_text, kind, values):
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} {kind}")
+            for labels, value in values:
+                if value is not None:
+                    lines.append(f"{p}_{name}{labels} {value}")
+
+        metric("rounds_total", "rounds recorded by this process", "counter", [("", self.rounds)])
+        metric("round_number", "last finished round", "gauge", [("", record["round"])])
+        metric("round_timestamp_seconds", "unix time the last round started", "gauge", [("", record["time"])])
+        metric("round_wall_seconds", "wall time of the last round", "gauge", [("", record["wall_seconds"])])
+        metric("round_cpu_seconds", "cpu time of the main process in the last round", "gauge", [("", record["cpu_seconds"])])
+
+        phases = record["phases"]
+        metric("round_phase_wall_seconds", "wall time of each phase of the last round", "gauge",
+               [(f'{{phase="{name}"}}', phases[name]["wall_seconds"]) for name in phases])
+        metric("round_phase_cpu_seconds", "main process cpu time of each phase of the last round", "gauge",
+               [(f'{{phase="{name}"}}', phases[name]["cpu_seconds"]) for name in phases])
+
+        metric("round_bot_steps_per_second", "bot steps simulated per second of the simulate phase", "gauge",
+               [("", record["bot_steps_per_second"])])
+
+        for name in sorted(record):
+            if name in ["round", "time", "wall_seconds", "cpu_seconds", "phases", "bot_steps_per_second"]:
+                continue
+            metric(f"round_{name}", f"{name} in the last round", "gauge", [("", record[name])])
+
+        with atomic_write(self.prometheus_path) as f:
+            f.write("\n".join(lines) + "\n")
+
+    def close(self):
+        self.finish_round()
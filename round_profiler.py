@@ -0,0 +1,167 @@
+import math
+import pstats
+import marshal
+import cProfile
+from util import atomic_write
+
+
+class profile_data:
+
+    def __init__(self, stats):
+
+        """
+        raw profile stats, as sent back by a worker, in the form pstats.Stats loads
+        """
+
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def profile_call(function, arg):
+
+    """
+    run function(arg) under cProfile. returns the result and the raw stats,
+    which pickle, so workers can send them back with their results
+    """
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        result = function(arg)
+    finally:
+        profile.disable()
+    profile.create_stats()
+    return(result, profile.stats)
+
+
+class round_profiler:
+
+    def __init__(self, path=None, rounds=None, fraction=1.0, top=50):
+
+        """
+        Profiles sampled rounds in the main process and in every pool worker.
+        Workers profile each batch they run and send the stats back with its
+        results (see round_worker). Everything is merged into one set of stats
+        over all profiled rounds.
+
+        After every profiled round these are written next to path:
+            path                - parent and workers merged, in the pstats format
+                                  (python -m pstats, snakeviz, gprof2dot)
+            path + ".workers"   - workers only
+            path + ".txt"       - the top functions of the merged stats by cumulative time
+
+        In the merged stats the parent's time waiting on the pool overlaps the
+        workers' time doing the work, so cumulative times add up to more than
+        the wall time.
+
+        A round's profile runs until the next round starts, as in round_metrics.
+        With no path the profiler is off.
+
+        path - pstats file to write
+        rounds - stop after this many profiled rounds, see done(). None for no limit
+        fraction - share of rounds to profile, spread evenly. e.g. 0.01 profiles every 100th round
+        top - functions in the text report
+        """
+
+        self.path = path
+        self.rounds = rounds
+        self.fraction = fraction
+        self.top = top
+        self.enabled = path is not None
+
+        self.profile = None
+        self.active = False
+        self.profiled_rounds = 0
+
+        self.parent = pstats.Stats()
+        self.workers = pstats.Stats()
+
+    def sampled(self, round_number):
+
+        """
+        whether a round is profiled. rounds are picked by number, without random
+        draws, so sampling leaves the simulation's random streams alone
+        """
+
+        if not self.enabled or self.done():
+            return(False)
+        return(math.floor((round_number + 1) * self.fraction) > math.floor(round_number * self.fraction))
+
+    def done(self):
+
+        """
+        whether rounds profiled rounds have run, counting one still being profiled
+        """
+
+        return(self.rounds is not None and self.profiled_rounds + int(self.active) >= self.rounds)
+
+    def start_round(self, round_number):
+
+        if not self.enabled:
+            return
+
+        self.finish_round()
+        if not self.sampled(round_number):
+            return
+
+        self.active = True
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def add_worker_stats(self, stats):
+
+        """
+        merge the raw stats a worker sent back
+        """
+
+        if len(stats) > 0:
+            self.workers.add(profile_data(stats))
+
+    def finish_round(self):
+
+        """
+        stop profiling the current round, if it is, and write out the stats so far
+        """
+
+        if not self.active:
+            return
+
+        self.profile.disable()
+        self.parent.add(self.profile)
+        self.profile = None
+        self.active = False
+        self.profiled_rounds += 1
+
+        self.write()
+
+    def merged(self):
+        stats = pstats.Stats()
+        stats.add(self.parent)
+        stats.add(self.workers)
+        return(stats)
+
+    def write(self):
+
+        """
+        write the stats files. each is replaced in one step
+        """
+
+        merged = self.merged()
+        self.dump(merged, self.path)
+        self.dump(self.workers, f"{self.path}.workers")
+
+        with atomic_write(f"{self.path}.txt") as f:
+            print(f"{self.profiled_rounds} profiled rounds, parent and workers merged", file=f)
+            merged.stream = f
+            merged.sort_stats("cumulative").print_stats(self.top)
+
+    def dump(self, stats, path):
+
+        # the format pstats.Stats.dump_stats writes
+        with atomic_write(path, "wb") as f:
+            marshal.dump(stats.stats, f)
+
+    def close(self):
+        self.finish_round()
@@ -0,0 +1,333 @@
+import math
+import numpy as np
+
+stat_names = ['mean_net_diff', 'mean_best_diff', 'mean_avg_diff', 'std_net_diff', 'std_best_diff', 'std_avg_diff']
+
+
+class stats_aggregator:
+
+    def __init__(self, genomes=[]):
+
+        """
+        Streaming per genome round stats. Bots, score summaries or compact result
+        rows can be added one at a time and in any order. Each genome keeps a
+        running count, mean and sum of squared differences (Welford) for its
+        net, best and average score differences.
+
+        genomes - optional genomes to register up front. get_round_stats lists
+                  genomes in registration order, so registering fixes the order
+                  however results arrive
+        """
+
+        # genome -> [count, [means], [sums of squared differences]]
+        self.stats = {}
+        for genome in genomes:
+            self.register(genome)
+
+    def register(self, genome):
+        if not genome in self.stats:
+            self.stats[genome] = [0, [0., 0., 0.], [0., 0., 0.]]
+        return(self.stats[genome])
+
+    def add(self, genome, net_diff, best_diff, avg_diff):
+
+        """
+        add one bot's score differences to its genome
+        """
+
+        s = self.register(genome)
+        s[0] += 1
+        n = s[0]
+        means = s[1]
+        m2 = s[2]
+
+        for k, x in enumerate((net_diff, best_diff, avg_diff)):
+            delta = x - means[k]
+            means[k] += delta / n
+            m2[k] += delta * (x - means[k])
+
+    def add_summary(self, genome, summary):
+
+        """
+        add one bot from its score summary (see util.summarize_scores)
+        """
+
+        start = summary["start"]
+        self.add(genome, float(summary["final"] - start), float(summary["max"] - start), float(summary["mean"] - start))
+
+    def add_summaries(self, bot_summaries, genomes_by_bot_name):
+        for bot_name in bot_summaries:
+            self.add_summary(genomes_by_bot_name[bot_name], bot_summaries[bot_name])
+
+    def add_bots(self, finished_bots, genomes_by_bot_name):
+        for bot in finished_bots:
+            self.add_summary(genomes_by_bot_name[bot.name], bot.score_summary())
+
+    def add_results(self, results, genomes):
+
+        """
+        add compact result rows from round_worker.run_batch
+
+        genomes - genome for each genome id in results["genome_ids"]
+        """
+
+        start = results["start"]
+        net = (results["final"] - start).tolist()
+        best = (results["max"] - start).tolist()
+        avg = (results["mean"] - start).tolist()
+        genome_ids = results["genome_ids"].tolist()
+
+        for i in range(len(genome_ids)):
+            self.add(genomes[genome_ids[i]], net[i], best[i], avg[i])
+
+    def merge(self, other):
+
+        """
+        fold another aggregator's stats into this one (Chan et al. pairwise update)
+        """
+
+        for genome in other.stats:
+            nb, means_b, m2_b = other.stats[genome]
+            if nb == 0:
+                continue
+
+            s = self.register(genome)
+            na = s[0]
+            n = na + nb
+            for k in range(3):
+                delta = means_b[k] - s[1][k]
+                s[1][k] += delta * nb / n
+                s[2][k] += m2_b[k] + delta * delta * na * nb / n
+            s[0] = n
+
+    def subset(self, genomes):
+
+        """
+        new aggregator holding copies of the stats of the given genomes that have results
+        """
+
+        sub = stats_aggregator()
+        for genome in genomes:
+            if genome in self:
+                n, means, m2 = self.stats[genome]
+                sub.stats[genome] = [n, list(means), list(m2)]
+        return(sub)
+
+    def __contains__(self, genome):
+        return(genome in self.stats and self.stats[genome][0] > 0)
+
+    def __len__(self):
+        return(len(self.stats))
+
+    def get_round_stats(self):
+
+        """
+        return round_stats: a dict keyed by genome of mean and std for each stat.
+        genomes without any bots are left out
+        """
+
+        round_stats = {}
+
+        for genome in self.stats:
+            n, means, m2 = self.stats[genome]
+            if n == 0:
+                continue
+
+            round_stats[genome] = {
+                "mean_net_diff"  : means[0],
+                "mean_best_diff" : means[1],
+                "mean_avg_diff"  : means[2],
+                "std_net_diff"   : math.sqrt(max(m2[0], 0.) / n),
+                "std_best_diff"  : math.sqrt(max(m2[1], 0.) / n),
+                "std_avg_diff"   : math.sqrt(max(m2[2], 0.) / n),
+            }
+
+        return(round_stats)
+
+    def get_round_table(self):
+
+        """
+        the same stats as get_round_stats, as a round_table
+        """
+
+        genomes = []
+        means = []
+        m2 = []
+        counts = []
+
+        for genome in self.stats:
+            n, genome_means, genome_m2 = self.stats[genome]
+            if n == 0:
+                continue
+            genomes.append(genome)
+            counts.append(n)
+            means.append(genome_means)
+            m2.append(genome_m2)
+
+        counts = np.array(counts, dtype=float).reshape(-1, 1)
+        means = np.array(means, dtype=float).reshape(-1, 3)
+        stds = np.sqrt(np.maximum(np.array(m2, dtype=float).reshape(-1, 3), 0.) / np.maximum(counts, 1))
+
+        columns = {}
+        for k in range(3):
+            columns[stat_names[k]] = means[:, k]
+            columns[stat_names[k + 3]] = stds[:, k]
+
+        return(round_table(genomes, columns))
+
+
+def top_k_indices(values, k, largest=True):
+
+    """
+    indices of the k largest (or smallest) values, best first, found with
+    argpartition so only the values at or past the k-th one are sorted.
+    tied values keep their input order and NaNs come last
+
+    values - 1d array
+    k - number of indices to return
+    largest - False picks the smallest values instead
+    """
+
+    values = np.asarray(values, dtype=float)
+    if largest:
+        values = -values
+
+    k = max(0, min(int(k), len(values)))
+    if k == 0:
+        return(np.zeros(0, dtype=int))
+    if k == len(values):
+        return(np.argsort(values, kind="stable"))
+
+    kth = values[np.argpartition(values, k - 1)[k - 1]]
+    if np.isnan(kth):
+        return(np.argsort(values, kind="stable")[:k])
+
+    # every value tied with the k-th is kept so ties break in input order
+    candidates = np.flatnonzero(values <= kth)
+    order = np.argsort(values[candidates], kind="stable")
+    return(candidates[order[:k]])
+
+
+class round_table:
+
+    def __init__(self, genomes, columns):
+
+        """
+        Columnar round stats: one row per genome and one array per stat. Rankings
+        are computed the first time a stat is ranked and kept, so the spawner, the
+        visualizer and the leaderboard all share one sort per stat per round.
+
+        Rows can also be read like the round_stats dict, e.g. table[genome]["mean_net_diff"].
+
+        genomes - one genome per row
+        columns - dict of stat name -> values, one per row
+        """
+
+        self.genomes = list(genomes)
+        self.index = {genome : i for i, genome in enumerate(self.genomes)}
+        self.columns = {stat : np.asarray(columns[stat], dtype=float) for stat in columns}
+
+        # stat -> row indices, best first
+        self.rankings = {}
+
+    @classmethod
+    def from_dict(cls, round_stats):
+
+        """
+        build a table from a round_stats dict (see stats_aggregator.get_round_stats)
+        """
+
+        genomes = list(round_stats.keys())
+        stats = []
+        if len(genomes) > 0:
+            stats = list(round_stats[genomes[0]].keys())
+
+        columns = {stat : [round_stats[g][stat] for g in genomes] for stat in stats}
+        return(cls(genomes, columns))
+
+    def column(self, stat):
+        return(self.columns[stat])
+
+    def ranking(self, stat):
+
+        """
+        row indices sorted by stat, highest first. tied rows keep their table order
+        """
+
+        if not stat in self.rankings:
+            self.rankings[stat] = np.argsort(-self.columns[stat], kind="stable")
+        return(self.rankings[stat])
+
+    def top(self, stat, n):
+
+        """
+        the first n rows of ranking(stat). when the stat hasn't been ranked yet only
+        the rows at or above the n-th value are sorted (see top_k_indices)
+        """
+
+        if stat in self.rankings:
+            return(self.ranking(stat)[:max(0, int(n))])
+        return(top_k_indices(self.columns[stat], n))
+
+    def ranked_genomes(self, stat, n=None):
+
+        """
+        genomes sorted by stat, highest first. all of them, or the first n
+        """
+
+        if n is None:
+            rows = self.ranking(stat)
+        else:
+            rows = self.top(stat, n)
+        return([self.genomes[i] for i in rows.tolist()])
+
+    def expand(self, aliases):
+
+        """
+        return a new table with extra rows that copy the stats of existing genomes
+
+        aliases - (genome, source genome) pairs. genomes already in the table are skipped
+        """
+
+        genomes = list(self.genomes)
+        rows = list(range(len(self.genomes)))
+        index = dict(self.index)
+
+        for genome, source in aliases:
+            if not genome in index:
+                index[genome] = len(genomes)
+                genomes.append(genome)
+                rows.append(self.index[source])
+
+        columns = {stat : self.columns[stat][rows] for stat in self.columns}
+        return(round_table(genomes, columns))
+
+    def to_dict(self):
+        return({genome : self[genome] for genome in self.genomes})
+
+    def keys(self):
+        return(list(self.genomes))
+
+    def __getitem__(self, genome):
+        i = self.index[genome]
+        return({stat : float(self.columns[stat][i]) for stat in self.columns})
+
+    def __contains__(self, genome):
+        return(genome in self.index)
+
+    def __iter__(self):
+        return(iter(self.genomes))
+
+    def __len__(self):
+        return(len(self.genomes))
+
+
+def as_round_table(round_stats):
+
+    """
+    round_stats as a round_table, converting a round_stats dict if needed
+    """
+
+    if isinstance(round_stats, round_table):
+        return(round_stats)
+    return(round_table.from_dict(round_stats))
@@ -0,0 +1,94 @@
+import time
+import numpy as np
+from util import run_bot
+from population_engine import population_engine
+from round_profiler import profile_call
+
+# set once per worker process by init_worker
+worker_gradient = None
+
+
+def init_worker(gradient):
+
+    """
+    pool initializer. keeps the gradient in the worker so batches don't carry it
+    """
+
+    global worker_gradient
+    worker_gradient = gradient
+
+
+def run_batch(batch):
+
+    """
+    simulate one batch of bots and return compact per bot results
+
+    batch - dict with
+        genome_ids   - ids of the genomes in this batch
+        bot_offset   - index of the batch's first bot in the round, sent back as is
+        coefficients - reduced genomes, one row per genome
+        individuals  - number of bots per genome
+        positions    - starting [x, y] per bot, grouped by genome
+        twists       - sensor rotation per bot
+        iterations   - steps to run
+        return_logs  - also send back full x, y and score histories
+        profile      - optional, profile the batch (see round_profiler)
+
+    returns a dict of arrays with one entry per bot, in input order:
+        genome_ids, start, final, max, mean
+        bot_offset - from the batch, so results can be placed when they arrive out of order
+        cpu_seconds - cpu time the worker spent on the batch
+        profile - raw profile stats, only for profiled batches
+        x, y, s - histories, one row per bot, only with return_logs
+    """
+
+    if batch.get("profile"):
+        results, stats = profile_call(simulate_batch, batch)
+        results["profile"] = stats
+        return(results)
+    return(simulate_batch(batch))
+
+
+def simulate_batch(batch):
+
+    """
+    run_batch without the profiler
+    """
+
+    start_cpu = time.process_time()
+
+    genome_ids = np.repeat(batch["genome_ids"], batch["individuals"])
+    coefficients = np.repeat(batch["coefficients"], batch["individuals"], axis=0)
+
+    log_level = "none"
+    if batch["return_logs"]:
+        log_level = "full"
+
+    engine = population_engine(worker_gradient, None, coefficients, batch["positions"], batch["twists"], log_level=log_level)
+    engine.run(batch["iterations"])
+
+    results = engine.get_score_summaries()
+    results["genome_ids"] = genome_ids
+    results["bot_offset"] = batch.get("bot_offset", 0)
+
+    if batch["return_logs"]:
+        results["x"] = np.stack(engine.log_x, axis=1)
+        results["y"] = np.stack(engine.log_y, axis=1)
+        results["s"] = np.stack(engine.log_s, axis=1)
+
+    results["cpu_seconds"] = time.process_time() - start_cpu
+    return(results)
+
+
+def run_bots(bots_to_run):
+    return([run_bot(args) for args in bots_to_run])
+
+
+def run_bots_profiled(bots_to_run):
+
+    """
+    run_bot for a list of (bot, iterations) under the profiler. returns the
+    finished bots and the raw profile stats
+    """
+
+    return(profile_call(run_bots, bots_to_run))
@@ -1,5 +1,6 @@
 from spawner import spawner
 from util import *
+from gradient_mixture import gradient_mixture
 import random
 import plotly.express as px
 import plotly.graph_objects as go
@@ -16,6 +17,7 @@ class sim:
         random.seed(seed)
 
         self.gradient, self.weights = gradient
+        self.mixture = gradient_mixture(self.gradient, self.weights)
         self.gradient_fig = go.Figure()
         self.curve_fig = go.Figure()
 
@@ -53,11 +55,7 @@ class sim:
         self.organisms.append(organism)
 
     def gradient_score(self, x, y):
-
-        score = 0
-        for i in range(len(self.gradient)):
-            score += self.gradient[i].pdf([x,y]) * self.weights[i]
-        return(score)
+        return(self.mixture.score(x, y))
 
     def run(self, iterations):
 
@@ -1,7 +1,10 @@
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from util import *
+from round_stats import as_round_table
+import numpy as np
 import json
+import heapq
 
 
 class sim_visualizer:
@@ -12,7 +15,7 @@ class sim_visualizer:
         self.gradient_trace = None
         if evo_sim:
             self.gradient_trace = self.make_countour_trace(
-                evo_sim.gradient,
+                evo_sim.mixture,
                 evo_sim.weights,
                 evo_sim.x_range,
                 evo_sim.y_range,
@@ -26,9 +29,20 @@ class sim_visualizer:
 
         move_log_dict = {}
         for bot in round_bots:
-            move_log_dict[bot.name] = bot.pos_log
+            if bot.pos_log is not None:
+                move_log_dict[bot.name] = bot.pos_log
         return(move_log_dict)
 
+    def round_bots_to_summary_dict(self, round_bots):
+        return(summarize_bots(round_bots))
+
+    def move_log_dict_to_summary_dict(self, move_log_dict):
+
+        summary_dict = {}
+        for b in move_log_dict:
+            summary_dict[b] = summarize_scores(move_log_dict[b]['s'])
+        return(summary_dict)
+
     def make_jsons(self, round_stats, round_bots, genome_by_bot_name, json_pfx=None):
         
         move_log_dict = self.round_bots_to_move_log_dict(round_bots)
@@ -38,17 +52,17 @@ class sim_visualizer:
                 json.dump(move_log_dict, j)
 
             with open(f"{json_pfx}_stats.json", 'w') as j:
-                json.dump(round_stats, j)
+                json.dump(as_round_table(round_stats).to_dict(), j)
 
             with open(f"{json_pfx}_genome_botname.json", 'w') as j:
                 json.dump(genome_by_bot_name, j)
 
 
-    def make_round_report(self, round_stats, move_log_dict, genome_by_bot_name, n, m, make_figures):
+    def make_round_report(self, round_stats, bot_summaries, move_log_dict, genome_by_bot_name, n, m, make_figures):
 
         """
         Inputs:
-            round_stats - Nested dictionary. The keys are raw genome strings (e.g. "[011]0[11][[11]11[00[0[...")
+            round_stats - round_table (see round_stats), or nested dictionary. The keys are raw genome strings (e.g. "[011]0[11][[11]11[00[0[...")
 
                 values - dictionary of stats.
                 
@@ -60,8 +74,14 @@ class sim_visualizer:
                 'mean_avg_diff'  - diff between starting gradient value and its average value over its life
 
                 there are also std vals for each of these (e.g. "std_net_diff")
+
+            bot_summaries - Nested dictionary. The keys are individual bot names
+
+                values dictionary of score summaries (see util.summarize_scores)
+                    start, final, max, mean
             
-            move_log_dict - Nested dictionary. The keys are individual bot names
+            move_log_dict - Nested dictionary. The keys are individual bot names. only
+                needed when make_figures is set
                 
                 values dictionary of coordinates and scores.
                     x : [x values]
@@ -84,8 +104,9 @@ class sim_visualizer:
 
         
         stats = ['mean_net_diff', 'mean_best_diff', 'mean_avg_diff']
+        round_stats = as_round_table(round_stats)
 
-        top_scoring_bots_by_stat = self.get_bots_to_display(stats, round_stats, move_log_dict, genome_by_bot_name, n, m)
+        top_scoring_bots_by_stat = self.get_bots_to_display(stats, round_stats, bot_summaries, genome_by_bot_name, n, m)
         all_top_scoring_bots = set()
 
         for stat in top_scoring_bots_by_stat:
@@ -137,29 +158,39 @@ class sim_visualizer:
 
         return(fig)
 
-    def get_bots_to_display(self, stats, round_stats, move_log_dict, genome_by_bot_name, n, m):
+    def get_bots_to_display(self, stats, round_stats, bot_summaries, genome_by_bot_name, n, m, largest=True):
 
         """
         Choose bots to appear in the score traces and gradient paths.
-        - pick the best performing n genomes
+        - pick the best performing n genomes that ran bots this round
         - for each genome pick the best performing m bots
+
+        largest=False picks the worst performing bots of those genomes instead
  
         return a dictionary of bot name lists indexed by the statistic used to choose them
         """
 
         bots_by_genome = self.reverse_genome_bot_dict(genome_by_bot_name)
-        ranked_genomes_by_stat = get_ranked_genomes_by_stat(round_stats, stats)
+        round_stats = as_round_table(round_stats)
 
         top_scoring_bots_by_stat = {}
 
         for stat in stats:
             top_scoring_bots_by_stat[stat] = []
-            ranked_genomes = ranked_genomes_by_stat[stat][0:n]
 
-            for g in ranked_genomes:
+            # genomes by table rank. genomes that share a phenotype with a simulated
+            # genome, and elites whose results were reused, have no bots of their own
+            # this round, so the walk goes on past them until n genomes have added bots
+            genomes_shown = 0
+            for g in round_stats.ranked_genomes(stat):
+                if genomes_shown == n:
+                    break
+                if not g in bots_by_genome:
+                    continue
                 bot_names = bots_by_genome[g]
-                top_scoring_bots = self.get_top_scoring_bots(bot_names, move_log_dict, stat, m)
+                top_scoring_bots = self.get_top_scoring_bots(bot_names, bot_summaries, stat, m, largest)
                 top_scoring_bots_by_stat[stat] += top_scoring_bots
+                genomes_shown += 1
 
         return top_scoring_bots_by_stat
 
@@ -188,10 +219,7 @@ class sim_visualizer:
         
         """
 
-        x = []
-
-        for g in round_stats:
-            x.append(round_stats[g][stat])
+        x = as_round_table(round_stats).column(stat)
 
         hist_go = go.Histogram(x=x)
         return(hist_go)
@@ -208,50 +236,27 @@ class sim_visualizer:
         
         return(bots_by_genome)
        
-    def get_top_scoring_bots(self, bot_names, move_log_dict, stat, m):
+    def get_top_scoring_bots(self, bot_names, bot_summaries, stat, m, largest=True):
 
-        #FIXME bugged. losing number between rounds
-        
         """
-        return a list of the best scoring bots to be used in example plots
+        return a list of the best scoring bots to be used in example plots, best first.
+        keeps a heap of size m, so picking costs O(bots log m). tied bots keep their order
 
         inputs:
             bot_names      -  names of set of bots
-            move_log_dict  -  x, y and score values indexed by bot name
+            bot_summaries  -  score summaries indexed by bot name
             stat           -  the stat to use for ranking
             m              -  the number of bots to return
+            largest        -  False returns the lowest scoring bots instead
 
         """
 
-        stat_functions = {
-            'mean_net_diff'  :  get_net_diff,
-            'mean_best_diff' :  get_best_diff,
-            'mean_avg_diff'  :  get_avg_diff
-        }
-
-        bots_by_score = {}
-        top_scoring = []
-
-        for b in bot_names:
-            gradient_vals = move_log_dict[b]['s']
-            score = stat_functions[stat](gradient_vals)
-            if not score in bots_by_score:
-                bots_by_score[score] = []
-            bots_by_score[score].append(b)
-
-        ordered_values = sorted(list(bots_by_score.keys()))
-
-        i = 0
-        while i < len(ordered_values) and len(top_scoring) < m:
-            tied_genomes = bots_by_score[ordered_values[i]]
-            j = 0
-            while j < len(tied_genomes) and len(top_scoring) < m:
-                top_scoring.append(tied_genomes[j])
-                j+=1
-            i+=1
-
-        return(top_scoring)
+        def bot_score(b):
+            return(get_summary_diff(bot_summaries[b], stat))
 
+        if largest:
+            return(heapq.nlargest(m, bot_names, key=bot_score))
+        return(heapq.nsmallest(m, bot_names, key=bot_score))
 
     def make_countour_trace(self, gradient, weights, x_range, y_range, steps=100):
 
@@ -265,23 +270,13 @@ class sim_visualizer:
         x_abs = x_range[1] - x_range[0]
         y_abs = y_range[1] - y_range[0]
 
-        x_vals = []
-        y_vals = []
-        first = True
-
-        z = []
-        for i in range(steps):
-            row = []
-            y = (y_abs/steps) * i + y_range[0] 
-            y_vals.append(y)
-            for j in range(steps):
-                x = (x_abs/steps) * j + x_range[0]
-                p = gradient_score(gradient, weights, x, y)
-                row.append(p)
-                if first:
-                    x_vals.append(x)
-            first = False
-            z.append(row)
+        x_vals = [(x_abs/steps) * j + x_range[0] for j in range(steps)]
+        y_vals = [(y_abs/steps) * i + y_range[0] for i in range(steps)]
+
+        # score the whole grid in one call, one row of z per y value
+        grid_x, grid_y = np.meshgrid(x_vals, y_vals)
+        points = np.stack([grid_x.ravel(), grid_y.ravel()], axis=1)
+        z = gradient_scores(gradient, weights, points).reshape(steps, steps).tolist()
         
         contour_trace = go.Contour(x=x_vals, y=y_vals, z=z, contours_coloring='heatmap')
         return(contour_trace)
@@ -332,5 +327,6 @@ if __name__ == "__main__":
         genome_by_bot_name = json.load(g)
     
     vis = sim_visualizer(None)
-    vis.make_round_report(bot_stats, move_logs, genome_by_bot_name, 5, 3, "figures/round_report.png")
+    bot_summaries = vis.move_log_dict_to_summary_dict(move_logs)
+    vis.make_round_report(bot_stats, bot_summaries, move_logs, genome_by_bot_name, 5, 3, "figures/round_report.png")
     
\ No newline at end of file
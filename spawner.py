@@ -1,6 +1,7 @@
 from util import *
 import numpy as np
 import random
+from mutation_engine import mutate_genomes
 
 
 class spawner:
@@ -23,6 +24,10 @@ class spawner:
         # next round params
         self.top_percent = 0.37
 
+        # mutate all parents at once on uint8 arrays (see mutation_engine).
+        # False uses the per genome string functions below
+        self.batched_mutation = True
+
         if mut_params == {}:
             self.mutation_params = {
                     "p_tandem_dupe"  : 0.1,
@@ -35,11 +40,11 @@ class spawner:
             self.mutation_params = mut_params
 
     
-    def spawn_next_round(self, round_stats, top_percent=0.2, mut_params=None):
+    def spawn_next_round(self, round_stats, top_percent=0.2, mut_params=None, registry=None):
 
         """
         Inputs:
-            round_stats - Nested dictionary. The keys are raw genome strings (e.g. "[011]0[11][[11]11[00[0[...")
+            round_stats - round_table (see round_stats), or nested dictionary. The keys are raw genome strings (e.g. "[011]0[11][[11]11[00[0[...")
 
                 values - dictionary of stats.
                 
@@ -54,6 +59,9 @@ class spawner:
 
             mean_offspring_per_genome - how many genomes to make for each selected genome. modified by scores
             mut_params - overrides class values. these params set mutation behavior
+            registry - genome_registry, when round_stats is keyed by genome id
+
+        returns the offspring genome strings
         """
 
         stats = ['mean_net_diff', 'mean_best_diff', 'mean_avg_diff']
@@ -71,6 +79,8 @@ class spawner:
         )
 
         parent_genomes = get_higest_scoring_genomes_across_stats(round_stats, stats, n)
+        if registry is not None:
+            parent_genomes = registry.get_many(parent_genomes)
         print(f"parents:\t{len(parent_genomes)}")
 
         offspring_genomes = self.mutate_and_spawn(parent_genomes, len(round_stats), mut_params)
@@ -87,19 +97,23 @@ class spawner:
         """
 
         mutated_genomes_lists = []
-        offspring_genomes = set(parent_genomes)
+        # dict keys as an ordered set. a set of strings iterates in hash order, which changes between processes
+        offspring_genomes = dict.fromkeys(parent_genomes)
         spawn_number = int(n/len(parent_genomes)) + 2
         print(f"carrying {len(parent_genomes)} ancestors over to next generation")
 
-        for g in parent_genomes:
-            mutated_genomes_lists.append(self.mutate(g, spawn_number, mut_params))
+        if self.batched_mutation:
+            mutated_genomes_lists = mutate_genomes(parent_genomes, spawn_number, mut_params)
+        else:
+            for g in parent_genomes:
+                mutated_genomes_lists.append(self.mutate(g, spawn_number, mut_params))
             
         i = 0
         while i < spawn_number and len(offspring_genomes) < n:
             print("selecting offspring")
             j = 0
             while j < len(mutated_genomes_lists) and len(offspring_genomes) < n:
-                offspring_genomes.add(mutated_genomes_lists[j][i])
+                offspring_genomes[mutated_genomes_lists[j][i]] = None
                 j += 1
             i += 1
 
@@ -107,7 +121,7 @@ class spawner:
     
     def mutate(self, parent_genome, spawn_number, mut_params):
 
-        mutated = set()
+        mutated = {}
 
         while len(mutated) < spawn_number:
             mutated_genome = parent_genome
@@ -118,7 +132,7 @@ class spawner:
                 mutated_genome = self.tandem_dupe(mutated_genome, mut_params["avg_seg_len"], mut_params["var_seg_len"])
 
             mutated_genome = self.add_point_mut(mutated_genome, mut_params["point_mut"])
-            mutated.add(mutated_genome)
+            mutated[mutated_genome] = None
 
         return(list(mutated))
 
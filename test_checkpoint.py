@@ -0,0 +1,95 @@
+import random
+import contextlib
+import io
+import numpy as np
+from evo_sim import evo_sim, leaderboard
+from checkpoint import checkpoint_writer, read_checkpoint, restore_state
+from leaderboard_log import leaderboard_log
+from leaderboard_store import leaderboard_store
+
+
+def make_run(tmp_path, engine):
+
+    """
+    a small evo_sim and a leaderboard writing to a log and store in tmp_path,
+    built the way the evo_sim main loop builds them
+    """
+
+    random.seed(11)
+    np.random.seed(11)
+
+    lboard_log = leaderboard_log(str(tmp_path / "leaderboard_log.tsv"), 3)
+    lboard_store = leaderboard_store(str(tmp_path / "leaderboard.db"), commit_every=2)
+    lboard = leaderboard(lboard_log, lboard_store, window=2, name_cache=8)
+    lboard.n = 5
+
+    sim = evo_sim(40, 3)
+    sim.genome_sim_iterations = 30
+    sim.engine = engine
+    sim.workers = 2
+    sim.reuse_elite_results = True
+    sim.elite_top_up = 1
+    return(sim, lboard)
+
+
+def run_rounds(sim, lboard, first, last, offspring, checkpoints=None, checkpoint_round=None):
+    for round in range(first, last):
+        sim.set_genomes_from_list(offspring)
+        round_results = sim.run_round(round)
+        offspring = round_results["offspring"]
+        lboard.add_round(round, round_results["top_scoring_bots_by_stat"], round_results["genome_by_bot_name"],
+                         round_stats=round_results["round_stats"], registry=sim.registry)
+
+        if round == checkpoint_round:
+            checkpoints.save(sim, lboard, round, offspring)
+    return(offspring)
+
+
+def finish(sim, lboard, offspring):
+
+    """
+    what a resumed run has to reproduce: the offspring, the next draws of both
+    random streams, the logged leaderboard and the names given
+    """
+
+    sim.close()
+    lboard.log.close()
+    with open(lboard.log.path, "rb") as f:
+        log = f.read()
+    names = lboard.store.get_names()
+    lboard.store.close()
+    return(offspring, random.random(), np.random.random(), log, names)
+
+
+def check_resume(tmp_path, engine):
+    rounds = 6
+    checkpoint_round = 3
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim, lboard = make_run(tmp_path, engine)
+        checkpoints = checkpoint_writer(str(tmp_path / "checkpoint.npz"), asynchronous=False)
+        sim.generate_random_genomes()
+        offspring = run_rounds(sim, lboard, 0, rounds, sim.starting_genomes, checkpoints, checkpoint_round)
+        expected = finish(sim, lboard, offspring)
+        checkpoints.close()
+
+        # the log and store still hold the rounds run after the checkpoint, as after a crash
+        sim, lboard = make_run(tmp_path, engine)
+        round, offspring = restore_state(sim, lboard, read_checkpoint(checkpoints.path))
+        lboard.log.truncate_after(round)
+        offspring = run_rounds(sim, lboard, round + 1, rounds, offspring)
+        resumed = finish(sim, lboard, offspring)
+
+    assert round == checkpoint_round
+    assert resumed[0] == expected[0]
+    assert resumed[1:3] == expected[1:3]
+    assert resumed[3] == expected[3]
+    assert resumed[4] == expected[4]
+
+
+def test_resume_matches_straight_run(tmp_path):
+    check_resume(tmp_path, "population")
+
+
+def test_resume_matches_straight_run_pool(tmp_path):
+    check_resume(tmp_path, "pool")
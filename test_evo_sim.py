@@ -0,0 +1,55 @@
+import numpy as np
+from evo_sim import evo_sim
+from util import get_functional_genome
+
+
+def reference_random_raw_genomes(sim, n, raw_genome_length, char_freq, min_length):
+
+    """
+    the original loop, one sequence drawn and checked at a time
+    """
+
+    genomes = []
+    while len(genomes) < n:
+        raw_seq = sim.make_random_sequence(raw_genome_length, char_freq)
+        if len(get_functional_genome(raw_seq, [0, len(raw_seq)])) >= min_length:
+            genomes.append(raw_seq)
+    return(genomes)
+
+
+def check_same_stream(args, seed):
+    sim = evo_sim(1, 1)
+
+    np.random.seed(seed)
+    expected = reference_random_raw_genomes(sim, *args)
+    expected_next = np.random.random()
+
+    np.random.seed(seed)
+    genomes = sim.get_random_raw_genomes(*args)
+    assert genomes == expected
+    assert np.random.random() == expected_next
+
+
+def test_random_raw_genomes_match_loop():
+    for seed in range(5):
+        check_same_stream((30, 200, [.25, .25, .25, .25], 20), seed)
+
+
+def test_random_raw_genomes_exact_fill():
+
+    # the second batch has exactly as many valid rows as are still needed, and
+    # rows drawn after the last one, which must be given back to the stream
+    check_same_stream((20, 100, [.4, .1, .25, .25], 10), 3)
+
+
+def test_random_raw_genomes_small_batches():
+    sim = evo_sim(1, 1)
+
+    np.random.seed(4)
+    expected = reference_random_raw_genomes(sim, 15, 100, [.3, .2, .25, .25], 15)
+    expected_next = np.random.random()
+
+    # a batch byte limit of a single row
+    np.random.seed(4)
+    assert sim.get_random_raw_genomes(15, 100, [.3, .2, .25, .25], 15, max_batch_bytes=1) == expected
+    assert np.random.random() == expected_next
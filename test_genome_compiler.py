@@ -0,0 +1,125 @@
+import random
+import numpy as np
+from util import get_functional_genome, sequence_to_tree
+from genome_bot import genome_bot
+from genome_compiler import compile_tree, compile_sequence, reduce_tree, reduce_sequence, reduce_genome, evaluate_coefficients
+from genome_compiler import evaluate_program, evaluate_programs, group_programs
+
+
+def random_sequence(rng, n, p_open, symbols="[]01"):
+    p_close = (1 - p_open) / 2
+    weights = [p_open, p_close] + [(1 - p_open - p_close) / (len(symbols) - 2)] * (len(symbols) - 2)
+    return("".join(rng.choices(symbols, weights=weights, k=n)))
+
+
+def random_sequences(seed, count):
+
+    """
+    raw strings, with unbalanced and unclosed lists, digits before sublists and
+    commas, and the functional genomes the simulation actually compiles
+    """
+
+    rng = random.Random(seed)
+    sequences = []
+    for t in range(count):
+        s = random_sequence(rng, rng.randint(0, 80), rng.choice([.2, .35, .5]), rng.choice(["[]01", "[]01,"]))
+        sequences.append(s)
+        sequences.append(get_functional_genome(s))
+    return(sequences)
+
+
+def evaluate_tree(tree, values):
+
+    # genome_bot.evaluate_tree only uses self to recurse
+    return(genome_bot.evaluate_tree(genome_bot.__new__(genome_bot), tree, values))
+
+
+def mod_distance(a, b):
+    d = np.abs(np.asarray(a) - np.asarray(b)) % 1
+    return(np.minimum(d, 1 - d))
+
+
+def test_compile_sequence_matches_compile_tree():
+    for s in random_sequences(11, 3000):
+        from_sequence = compile_sequence(s)
+        from_tree = compile_tree(sequence_to_tree(s))
+        assert from_sequence.ops.tolist() == from_tree.ops.tolist(), s
+        assert from_sequence.args.tolist() == from_tree.args.tolist(), s
+
+
+def test_reduction_matches_evaluate_tree():
+    rng = np.random.RandomState(12)
+    for s in random_sequences(13, 1500):
+        tree = sequence_to_tree(s)
+        coefficients = reduce_tree(tree)
+        assert coefficients.tolist() == reduce_sequence(s).tolist(), s
+
+        # values as genome_bot builds them: sensor angles, distances and differences
+        values = np.concatenate([rng.random(3), rng.uniform(0, .2, 3), rng.uniform(-.1, .1, 3)])
+        expected = evaluate_tree(tree, values.tolist())
+        assert mod_distance(np.dot(coefficients, values) % 1, expected) < 1e-9, s
+
+
+def test_reduce_genome_uses_functional_genome():
+    rng = random.Random(14)
+    for t in range(500):
+        raw = random_sequence(rng, rng.randint(0, 200), .3)
+        assert reduce_genome(raw).tolist() == reduce_sequence(get_functional_genome(raw)).tolist()
+
+
+def test_evaluate_coefficients_matches_evaluate_tree():
+    rng = np.random.RandomState(15)
+    sequences = random_sequences(16, 200)
+    trees = [sequence_to_tree(s) for s in sequences]
+    coefficients = np.array([reduce_tree(t) for t in trees])
+
+    # one column of values per bot
+    values = rng.uniform(-1, 1, size=(9, len(trees)))
+    results = evaluate_coefficients(coefficients, values)
+
+    expected = [evaluate_tree(trees[i], values[:, i].tolist()) for i in range(len(trees))]
+    assert (mod_distance(results, expected) < 1e-9).all()
+
+
+def test_deep_sequence_compiles_without_recursion():
+    depth = 20000
+    s = "[" * depth + "1" + "]" * depth
+    program = compile_sequence(s)
+    assert len(program) == depth + 2
+    assert reduce_sequence(s).tolist() == [0, 1, 0, 0, 0, 0, 0, 0, 0]
+
+
+def test_evaluate_program_matches_evaluate_tree():
+
+    # the postfix evaluator adds in the tree's order, so it matches exactly
+    rng = np.random.RandomState(17)
+    for s in random_sequences(18, 500):
+        tree = sequence_to_tree(s)
+        values = rng.uniform(-1, 1, size=(9, 4))
+        expected = [evaluate_tree(tree, values[:, i].tolist()) for i in range(4)]
+        assert evaluate_program(compile_sequence(s), values).tolist() == expected, s
+
+
+def test_evaluate_programs_matches_each_program():
+    rng = np.random.RandomState(19)
+    programs = [compile_sequence(s) for s in random_sequences(20, 30)]
+
+    # several bots share each program object, in no particular order
+    bot_programs = [programs[i] for i in rng.randint(0, len(programs), 150)]
+    values = rng.uniform(-1, 1, size=(9, len(bot_programs)))
+    expected = [evaluate_program(bot_programs[i], values[:, [i]])[0] for i in range(len(bot_programs))]
+
+    groups = group_programs(bot_programs)
+    assert sorted(np.concatenate([idx for program, idx in groups]).tolist()) == list(range(len(bot_programs)))
+    for program, idx in groups:
+        assert all(bot_programs[i] is program for i in idx.tolist())
+
+    assert evaluate_programs(bot_programs, values).tolist() == expected
+    assert evaluate_programs(bot_programs, values, groups).tolist() == expected
+
+
+def test_deep_program_evaluates_without_recursion():
+    depth = 20000
+    program = compile_sequence("[" * depth + "1" + "]" * depth)
+    values = np.arange(9 * 2, dtype=float).reshape(9, 2) / 20
+    assert evaluate_program(program, values).tolist() == (values[1] % 1).tolist()
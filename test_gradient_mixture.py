@@ -0,0 +1,82 @@
+import random
+import numpy as np
+from scipy.stats import multivariate_normal
+from gradient_mixture import gradient_mixture, gradient_lattice
+
+
+def random_gradient(rng, components):
+
+    """
+    a weighted mixture of bivariate normals with random means and covariances,
+    as the list of scipy distributions and weights evo_sim builds
+    """
+
+    gradient = []
+    for k in range(components):
+        a = rng.uniform(-1, 1, size=(2, 2))
+        cov = a @ a.T + rng.uniform(.05, .5) * np.eye(2)
+        gradient.append(multivariate_normal(rng.uniform(-1, 1, size=2), cov))
+
+    weights = rng.random(components)
+    return(gradient, (weights / weights.sum()).tolist())
+
+
+def scipy_scores(gradient, weights, points):
+    return(sum(w * g.pdf(points) for g, w in zip(gradient, weights)))
+
+
+def test_matches_scipy():
+    rng = np.random.RandomState(5)
+    for components in [1, 2, 3, 10]:
+        gradient, weights = random_gradient(rng, components)
+        mixture = gradient_mixture(gradient, weights)
+
+        points = rng.uniform(-1.5, 1.5, size=(500, 2))
+        expected = scipy_scores(gradient, weights, points)
+
+        assert np.allclose(mixture.score_points(points), expected, rtol=1e-12, atol=0)
+        assert np.allclose([mixture.score(x, y) for x, y in points.tolist()], expected, rtol=1e-12, atol=0)
+
+
+def test_matches_scipy_identity_covariance():
+
+    # the gradient evo_sim builds, with its default covariance
+    rng = random.Random(6)
+    gradient = [multivariate_normal([rng.uniform(-1, 1), rng.uniform(-1, 1)]) for k in range(3)]
+    weights = [.5, .3, .2]
+    mixture = gradient_mixture(gradient, weights)
+
+    points = [[rng.uniform(-1, 1), rng.uniform(-1, 1)] for i in range(200)]
+    expected = scipy_scores(gradient, weights, np.array(points))
+    assert np.allclose(mixture.score_points(points), expected, rtol=1e-12, atol=0)
+
+
+def test_short_lists_match_arrays():
+
+    # short lists are scored point by point, longer input as arrays
+    rng = np.random.RandomState(7)
+    gradient, weights = random_gradient(rng, 4)
+    mixture = gradient_mixture(gradient, weights)
+
+    for n in [0, 1, 4, 8, 9, 50]:
+        points = rng.uniform(-1, 1, size=(n, 2))
+        assert np.allclose(mixture.score_points(points.tolist()), mixture.score_points(points), rtol=1e-14, atol=0)
+
+
+def test_lattice_single_points_match_arrays():
+    rng = np.random.RandomState(8)
+    gradient, weights = random_gradient(rng, 3)
+
+    for method in ["bilinear", "bicubic"]:
+        lattice = gradient_lattice(gradient, weights, [-1, 1], [-1, 1], step=0.05, method=method)
+
+        # some points fall past the margin and are scored exactly
+        points = rng.uniform(-1.5, 1.5, size=(500, 2))
+        scores = lattice.score_points(points)
+        assert np.allclose([lattice.score(x, y) for x, y in points.tolist()], scores, rtol=1e-12, atol=1e-15)
+
+        outside = np.abs(points).max(axis=1) > 1.25
+        assert outside.any()
+        assert np.allclose(scores[outside], scipy_scores(gradient, weights, points[outside]), rtol=1e-12, atol=0)
+
+        assert lattice.max_error(2000) < 1e-2
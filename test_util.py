@@ -0,0 +1,105 @@
+import random
+import numpy as np
+from util import get_functional_genome, get_functional_lengths
+
+
+def reference_functional_genome(sequence, coords=None):
+
+    """
+    the original O(n * k) get_functional_genome, kept to check the single pass version against
+    """
+
+    if not coords:
+        coords = [0, len(sequence)]
+
+    if not coords[1] - coords[0] > 1 or coords[1] > len(sequence):
+        return('[]')
+
+    rough_subseq = '[' + sequence[coords[0]:coords[1]] + ']'
+    stack_heights = {}  # track running differences of opens and closes
+    substr_ends   = {}  # track the index where each stack becomes empty
+
+    for i in range(len(rough_subseq)):
+
+        if rough_subseq[i] == '[':
+            stack_heights[i] = 0
+
+        for h in stack_heights:
+            to_remove = []
+
+            if rough_subseq[i] == '[':
+                stack_heights[h] += 1
+
+            if rough_subseq[i] == ']':
+                stack_heights[h] -= 1
+
+                if stack_heights[h] == 0:
+                    to_remove.append(h)
+                    substr_ends[h] = i + 1
+
+        for h in to_remove:
+            stack_heights.pop(h, None)
+
+    max_len = 0
+    max_len_substr = ''
+    for s in substr_ends:
+        if max_len < substr_ends[s] - s:
+            max_len = substr_ends[s] - s
+            max_len_substr = rough_subseq[s:substr_ends[s]]
+    return(max_len_substr)
+
+
+def random_sequence(rng, n, p_open):
+    p_close = (1 - p_open) / 2
+    return("".join(rng.choices("[]01", weights=[p_open, p_close, (1 - p_open - p_close) / 2, (1 - p_open - p_close) / 2], k=n)))
+
+
+def test_matches_reference_on_random_sequences():
+    rng = random.Random(7)
+    for t in range(3000):
+        s = random_sequence(rng, rng.randint(0, 60), rng.choice([.1, .25, .4, .6]))
+        assert get_functional_genome(s) == reference_functional_genome(s), s
+
+
+def test_matches_reference_with_coords():
+    rng = random.Random(8)
+    for t in range(3000):
+        s = random_sequence(rng, rng.randint(0, 40), rng.choice([.25, .4]))
+
+        # coords[1] may run past the end of the sequence
+        start = rng.randint(0, len(s) + 2)
+        end = rng.randint(0, len(s) + 5)
+        coords = [start, end]
+        assert get_functional_genome(s, coords) == reference_functional_genome(s, coords), (s, coords)
+
+
+def test_short_and_out_of_range():
+    for s in ["", "[", "]", "0", "[]"]:
+        assert get_functional_genome(s) == reference_functional_genome(s)
+
+    s = "[01][[1]]0"
+    for coords in [[0, 1], [3, 4], [5, 5], [4, 2], [0, len(s) + 1], [2, 100]]:
+        assert get_functional_genome(s, coords) == reference_functional_genome(s, coords) == '[]'
+
+
+def test_unbalanced_runs():
+    for s in ["]]]]", "[[[[", "]]]][[[[", "[[[[]]]]]]]]", "]]][[[0]]][[[", "[[0]1]]]]][[[[[1[0]", "][][][]["]:
+        assert get_functional_genome(s) == reference_functional_genome(s), s
+
+
+def test_functional_lengths_match():
+    rng = random.Random(9)
+    sequences = [random_sequence(rng, 50, rng.choice([.25, .4, .6])) for i in range(500)]
+    matrix = np.frombuffer("".join(sequences).encode("ascii"), dtype=np.uint8).reshape(len(sequences), 50)
+    expected = [len(reference_functional_genome(s)) for s in sequences]
+    assert get_functional_lengths(matrix).tolist() == expected
+
+
+def test_functional_lengths_long_rows():
+
+    # rows past 2**15 symbols walk in int32 rather than int16
+    rng = random.Random(10)
+    sequences = ["[" * 20000 + random_sequence(rng, 13000, .3) + "]" * 20000 for i in range(3)]
+    matrix = np.frombuffer("".join(sequences).encode("ascii"), dtype=np.uint8).reshape(3, -1)
+    expected = [len(get_functional_genome(s)) for s in sequences]
+    assert get_functional_lengths(matrix).tolist() == expected
@@ -1,5 +1,33 @@
+import os
+import contextlib
 import numpy as np
-import math
+from gradient_mixture import gradient_mixture
+from round_stats import stats_aggregator, as_round_table
+
+@contextlib.contextmanager
+def atomic_write(path, mode="w"):
+
+    """
+    open a file to replace path in one step. the data is written next to it, synced
+    to disk and moved into place on a clean exit, so readers and a crash only ever
+    see the old file or the whole new one
+
+        with atomic_write(path) as f:
+            f.write(text)
+    """
+
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
 
 def get_functional_genome(sequence, coords=None):
 
@@ -13,45 +41,73 @@ def get_functional_genome(sequence, coords=None):
     if not coords[1] - coords[0] > 1 or coords[1] > len(sequence):
         return('[]')
 
-    rough_subseq = '[' + sequence[coords[0]:coords[1]] + ']'              
-    stack_heights = {}  # track running differences of opens and closes
-    substr_ends   = {}  # track the index where each stack becomes empty
+    rough_subseq = '[' + sequence[coords[0]:coords[1]] + ']'
+    open_positions = []  # positions of the brackets that are still open
 
-    # iterate over the sequences, updating each potential subsequence
-    for i in range(len(rough_subseq)):
+    # match each close bracket to the most recent open one in a single pass.
+    # unmatched close brackets are skipped. ties keep the first substring to close
+    max_start = 0
+    max_end = 0
+    for i, c in enumerate(rough_subseq):
+        if c == '[':
+            open_positions.append(i)
+        elif c == ']' and open_positions:
+            start = open_positions.pop()
+            if max_end - max_start < i + 1 - start:
+                max_start = start
+                max_end = i + 1
 
-        # create a new potential start at position i when encountering an open bracket
-        if rough_subseq[i] == '[':
-            stack_heights[i] = 0
+    return(rough_subseq[max_start:max_end])
 
-        # update existing stacks (whether or not one was just created)
-        for h in stack_heights:
-            to_remove = []
 
-            # If the current character is an open bracket 
-            if rough_subseq[i] == '[':  
-                stack_heights[h] += 1
+def get_functional_lengths(sequences):
+
+    """
+    length of get_functional_genome(s) for every row of an ascii matrix at once
+
+    sequences - uint8 array, one sequence per row, all the same length
+
+    brackets are matched on the depth walk: the running sum of +1 per '[' and -1
+    per ']', held at zero where get_functional_genome skips an unmatched ']'.
+    on each level an open is closed by the next step back down to that level,
+    so sorting the steps by row, level and position lines every pair up
+    """
+
+    sequences = np.asarray(sequences, dtype=np.uint8)
+    m, n = sequences.shape
+    if n <= 1:
+        return(np.full(m, 2, dtype=np.int64))
 
-            # If the current character is an close bracket
-            if rough_subseq[i] == ']':
-                stack_heights[h] -= 1
+    # the walk never leaves [-(n + 2), n + 2], so the (m, n + 2) arrays below fit a small int
+    dtype = np.int16
+    if n + 2 >= 2**15:
+        dtype = np.int32
 
-                # close off a balanced substring
-                if stack_heights[h] == 0:
-                    to_remove.append(h)
-                    substr_ends[h] = i + 1
+    # the sequence is wrapped in one more pair of brackets, as in get_functional_genome
+    steps = np.zeros((m, n + 2), dtype=dtype)
+    steps[:, 0] = 1
+    steps[:, 1:-1] = (sequences == ord('[')).astype(dtype) - (sequences == ord(']'))
+    steps[:, -1] = -1
 
-        # clean up finished stacks
-        for h in to_remove:
-            stack_heights.pop(h, None)
+    walk = np.cumsum(steps, axis=1, dtype=dtype)
+    depth = walk - np.minimum(np.minimum.accumulate(walk, axis=1), 0)
 
-    max_len = 0
-    max_len_substr = ''
-    for s in substr_ends:
-        if max_len < substr_ends[s] - s:
-            max_len = substr_ends[s] - s
-            max_len_substr = rough_subseq[s:substr_ends[s]]
-    return(max_len_substr)
+    # depth before each step. a step changes level only if the depth moved
+    before = np.zeros_like(depth)
+    before[:, 1:] = depth[:, :-1]
+    row, pos = np.nonzero(depth != before)
+    level = np.minimum(depth, before)[row, pos]
+    opens = depth[row, pos] > before[row, pos]
+
+    order = np.lexsort((pos, level, row))
+    row, pos, level, opens = row[order], pos[order], level[order], opens[order]
+
+    # an open followed by a close on the same row and level is a matched pair
+    paired = opens[:-1] & ~opens[1:] & (row[:-1] == row[1:]) & (level[:-1] == level[1:])
+
+    lengths = np.zeros(m, dtype=np.int64)
+    np.maximum.at(lengths, row[:-1][paired], pos[1:][paired] - pos[:-1][paired] + 1)
+    return(lengths)
 
 
 def sequence_to_tree(s):
@@ -106,28 +162,12 @@ def rank_genomes_by_stat(round_stats, stat):
     """
     rank genomes for the given stat and return the sorted list
 
-    round_stats - Nested dict. keys are raw genome sequences, vals are a dictionary of stats
+    round_stats - round_table, or nested dict. keys are raw genome sequences, vals are a dictionary of stats
 
     stat - the stat to use for ranking
     """
 
-    ranked_genomes = []
-    
-    genome_by_stat_value = {}
-    for g in round_stats:
-        stat_val = round_stats[g][stat]
-        if not stat_val in genome_by_stat_value:
-            genome_by_stat_value[stat_val] = []
-        genome_by_stat_value[stat_val].append(g)
-    
-    ordered_values = sorted(list(genome_by_stat_value.keys()), reverse=True)
-
-    for stat_val in ordered_values:
-        tied_genomes = genome_by_stat_value[stat_val]
-        for genome in tied_genomes:
-            ranked_genomes.append(genome)
-
-    return(ranked_genomes)
+    return(as_round_table(round_stats).ranked_genomes(stat))
 
 def get_ranked_genomes_by_stat(round_stats, stats):
 
@@ -136,11 +176,12 @@ def get_ranked_genomes_by_stat(round_stats, stats):
         - keys: stats
         - vals: list of genomes sorted by stat value
 
-    round_stats - Nested dict. keys are raw genome sequences, vals are a dictionary of stats
+    round_stats - round_table, or nested dict. keys are raw genome sequences, vals are a dictionary of stats
 
     stats - list of stats to use for ranking
     """
 
+    round_stats = as_round_table(round_stats)
     ranked_genome_lists_by_stat = {}
 
     for stat in stats:
@@ -154,74 +195,74 @@ def get_higest_scoring_genomes_across_stats(round_stats, stats, n):
     """
     get the higest scoring genomes across a list of stats. return a total of n genomes. 
 
-    round_stats - Nested dict. keys are raw genome sequences, vals are a dictionary of stats
+    round_stats - round_table, or nested dict. keys are raw genome sequences, vals are a dictionary of stats
 
     stats - list of stats to use for ranking
     """
 
-    ranked_genome_lists_by_stat = get_ranked_genomes_by_stat(round_stats, stats)
-
-    min_list_len = math.inf
-    for stat in ranked_genome_lists_by_stat:
-        if len(ranked_genome_lists_by_stat[stat]) < min_list_len:
-            min_list_len = len(ranked_genome_lists_by_stat[stat])
+    round_stats = as_round_table(round_stats)
+    rankings = [round_stats.ranking(stat).tolist() for stat in stats]
 
-    selected_genomes = set()
+    # insertion ordered, so the selection doesn't depend on string hashing
+    selected_genomes = {}
 
     i = 0
-    while i < min_list_len and len(selected_genomes) < n:
+    while i < len(round_stats) and len(selected_genomes) < n:
         j = 0
         while j < len(stats) and len(selected_genomes) < n:
-            stat = stats[j]
-            selected_genomes.add(ranked_genome_lists_by_stat[stat][i])
+            selected_genomes[round_stats.genomes[rankings[j][i]]] = None
             j += 1
         i += 1
 
     return(list(selected_genomes))
 
 
-def summarize_run(finished_bots, genomes_by_bot_name):
+def summarize_scores(scores):
+
+    """
+    reduce a bot's score history to the values the round stats are built from
+    """
 
-    raw_scores_by_genome = {}
-    stats_by_genome = {}
+    return({"start" : scores[0],
+            "final" : scores[-1],
+            "max"   : max(scores),
+            "mean"  : np.average(scores)})
 
+def summarize_bots(finished_bots):
+
+    """
+    score summaries of finished bots, keyed by bot name
+    """
+
+    bot_summaries = {}
     for bot in finished_bots:
+        bot_summaries[bot.name] = bot.score_summary()
+    return(bot_summaries)
 
-        genome = genomes_by_bot_name[bot.name]
-        if not genome in raw_scores_by_genome:
-            raw_scores_by_genome[genome] = {
-                "net_diffs"    : [],
-                "maxima_diffs"   : [],
-                "average_diffs" : []
-            }
-
-            score_diff = bot.pos_log['s'][-1] - bot.pos_log['s'][0]
-            raw_scores_by_genome[genome]["net_diffs"].append(score_diff)
-
-            score_diff = np.average(bot.pos_log['s']) - bot.pos_log['s'][0]
-            raw_scores_by_genome[genome]["average_diffs"].append(score_diff)
-
-            maximum = max(bot.pos_log['s']) - bot.pos_log['s'][0]
-            raw_scores_by_genome[genome]["maxima_diffs"].append(maximum)
-
-
-    for genome in raw_scores_by_genome:
-        stats_by_genome[genome] = {
-            "mean_net_diff" : np.average(
-                raw_scores_by_genome[genome]["net_diffs"]),
-            "mean_best_diff" : np.average(
-                raw_scores_by_genome[genome]["maxima_diffs"]),
-            "mean_avg_diff" : np.average(
-                raw_scores_by_genome[genome]["average_diffs"]),
-            "std_net_diff" : np.std(
-                raw_scores_by_genome[genome]["net_diffs"]),
-            "std_best_diff" : np.std(
-                raw_scores_by_genome[genome]["maxima_diffs"]),
-            "std_avg_diff" : np.average(
-                raw_scores_by_genome[genome]["average_diffs"]),
-        }
-
-    return(stats_by_genome)
+# the summary value each genome stat is measured from
+summary_key_by_stat = {
+    'mean_net_diff'  : 'final',
+    'mean_best_diff' : 'max',
+    'mean_avg_diff'  : 'mean'
+}
+
+def get_summary_diff(summary, stat):
+
+    """
+    a single bot's value for a genome stat, from its score summary
+    """
+
+    return(summary[summary_key_by_stat[stat]] - summary["start"])
+
+def summarize_run(finished_bots, genomes_by_bot_name):
+
+    """
+    per genome round stats (see round_stats.stats_aggregator) for a list of finished bots
+    """
+
+    aggregator = stats_aggregator()
+    aggregator.add_bots(finished_bots, genomes_by_bot_name)
+    return(aggregator.get_round_stats())
 
 def select_surviving_simulations(bot_stats, top_percent=.1):
 
@@ -260,11 +301,34 @@ def gradient_score(gradients, weights, x, y):
     calculate a gradient score at specific x,y position
 
     inputs:
-    - gradient - a list of distribution objects
-    - weights - a list of weights summing to one
+    - gradient - a list of distribution objects, or a gradient_mixture
+    - weights - a list of weights summing to one (already folded into a gradient_mixture)
     """
 
+    if isinstance(gradients, gradient_mixture):
+        return(gradients.score(x, y))
+
     score = 0
     for i in range(len(gradients)):
         score += gradients[i].pdf([x,y]) * weights[i]
-    return(score)
\ No newline at end of file
+    return(score)
+
+def gradient_scores(gradients, weights, points):
+
+    """
+    calculate gradient scores for many x,y positions at once
+
+    inputs:
+    - gradient - a list of distribution objects, or a gradient_mixture
+    - weights - a list of weights summing to one (already folded into a gradient_mixture)
+    - points - array of positions, one [x, y] row per point
+    """
+
+    if isinstance(gradients, gradient_mixture):
+        return(gradients.score_points(points))
+
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    scores = np.zeros(len(points))
+    for i in range(len(gradients)):
+        scores += gradients[i].pdf(points) * weights[i]
+    return(scores)